@@ -1,11 +1,28 @@
+import argparse
+import concurrent.futures
 import subprocess
 import os
-import urllib.request
 import json
+import hashlib
+import heapq
+import random
+import re
+import shutil
+import sqlite3
 import time
 import sys
+import threading
+import queue
+import urllib.parse
+from collections import deque
 from urllib.error import HTTPError, URLError
 
+# yt-dlp can also run inside YTGet as a library, which saves a process start, the extractor
+# imports and a cold HTTP connection on every call. Without the yt_dlp package the yt-dlp
+# executable is used. The package is only imported once the library backend is chosen, since
+# importing it costs more than the rest of YTGet's startup.
+yt_dlp = None
+
 __version__ = '1.1.9'
 
 # ANSI escape codes for colors
@@ -30,34 +47,119 @@ class Colors:
 def print_colored(message, color):
     print(f"{color}{message}{Colors.RESET}")
 
+# Utility function to format a byte count for display
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{int(size)}B"
+        size /= 1024
+
+# Lock guarding the shared config and YTGet_Conf.json while queue workers are running
+config_lock = threading.RLock()
+
+# urllib.request is imported inside the network functions: it pulls in ssl and http.client,
+# which the headless commands never need, and keeping it out makes them start much faster
+# Network calls made at startup give up after this many seconds, so a flaky link cannot hold up the menu
+NETWORK_TIMEOUT = 5
+# Release metadata from the GitHub API is cached with its ETag and Last-Modified headers: a conditional request
+# answered with 304 Not Modified does not count against GitHub's rate limit, and the cached copy is used offline
+RELEASE_CACHE_FILE = 'YTGet_Release_Cache.json'
+release_cache_lock = threading.Lock()
+# Updates are streamed to disk in chunks of this size instead of being read into memory whole
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Function to check internet connectivity using urllib
-def check_internet_connectivity():
+def check_internet_connectivity(report=print_colored):
+    import urllib.request
     try:
-        response = urllib.request.urlopen('https://www.youtube.com', timeout=5)
+        response = urllib.request.urlopen('https://www.youtube.com', timeout=NETWORK_TIMEOUT)
         return response.status == 200
-    except (HTTPError, URLError) as e:
-        print_colored(f"Error checking internet connectivity: {e}", Colors.LIGHT_RED)
+    except (HTTPError, URLError, OSError) as e:
+        report(f"Error checking internet connectivity: {e}", Colors.LIGHT_RED)
         return False
 
-# Function to get the latest version from GitHub for YTGet.py
-def get_latest_version_youtube():
-    url = "https://api.github.com/repos/ErfanNamira/YTGet/releases/latest"
+# Function to load the cached release metadata, keyed by API URL
+def load_release_cache():
     try:
-        with urllib.request.urlopen(url) as response:
+        with open(RELEASE_CACHE_FILE, 'r') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+# Function to get release metadata from the GitHub API, revalidating the cached copy with a conditional request.
+# Falls back to the cached copy when GitHub cannot be reached or rate-limits the request.
+def fetch_release_metadata(url):
+    import urllib.request
+    with release_cache_lock:
+        entry = load_release_cache().get(url)
+    request = urllib.request.Request(url, headers={'Accept': 'application/vnd.github+json'})
+    if entry and entry.get("etag"):
+        request.add_header('If-None-Match', entry["etag"])
+    if entry and entry.get("last_modified"):
+        request.add_header('If-Modified-Since', entry["last_modified"])
+    try:
+        with urllib.request.urlopen(request, timeout=NETWORK_TIMEOUT) as response:
             data = json.loads(response.read().decode())
-            return data['tag_name'].strip()
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    except (HTTPError, URLError, OSError):
+        # 304 Not Modified arrives as an HTTPError too
+        if entry:
+            return entry["data"]
+        raise
+    with release_cache_lock:
+        cache = load_release_cache()
+        cache[url] = {"etag": etag, "last_modified": last_modified, "data": data}
+        with open(RELEASE_CACHE_FILE + '.tmp', 'w') as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(RELEASE_CACHE_FILE + '.tmp', RELEASE_CACHE_FILE)
+    return data
+
+# Function to get the SHA-256 GitHub publishes for a release asset, or None when it has none
+def get_release_asset_sha256(repository, tag, asset_name):
+    release = fetch_release_metadata(f"https://api.github.com/repos/{repository}/releases/tags/{tag}")
+    for asset in release.get('assets', []):
+        if asset.get('name') == asset_name and (asset.get('digest') or '').startswith('sha256:'):
+            return asset['digest'][len('sha256:'):]
+    return None
+
+# Function to stream a download to a temporary file, check its SHA-256 and move it into place in one step,
+# so an interrupted or corrupt download never replaces a working file
+def download_release_asset(url, destination, sha256=None):
+    import urllib.request
+    temp_path = destination + '.part'
+    digest = hashlib.sha256()
+    try:
+        with urllib.request.urlopen(url, timeout=NETWORK_TIMEOUT * 6) as response, open(temp_path, 'wb') as out_file:
+            for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out_file.write(chunk)
+        if sha256 and digest.hexdigest() != sha256.lower():
+            raise ValueError(f"Checksum mismatch for {os.path.basename(destination)}")
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Function to get the latest version from GitHub for YTGet.py
+def get_latest_version_youtube(report=print_colored):
+    try:
+        return fetch_release_metadata("https://api.github.com/repos/ErfanNamira/YTGet/releases/latest")['tag_name'].strip()
     except Exception as e:
-        print_colored(f"Error fetching latest version: {e}", Colors.LIGHT_RED)
+        report(f"Error fetching latest version: {e}", Colors.LIGHT_RED)
         return None
 
-# Function to download the latest YTGet.py
-def download_latest_version_youtube(latest_version):
+# Function to download the latest YTGet.py. Returns True when it was downloaded and verified.
+def download_latest_version_youtube(latest_version, report=print_colored):
     download_url = f"https://github.com/ErfanNamira/YTGet/releases/download/{latest_version}/YTGet.py"
     try:
-        with urllib.request.urlopen(download_url) as response, open("YTGet_new.py", "wb") as out_file:
-            out_file.write(response.read())
+        sha256 = get_release_asset_sha256('ErfanNamira/YTGet', latest_version, 'YTGet.py')
+        if not sha256:
+            report("No checksum is published for this release. The download cannot be verified.", Colors.LIGHT_YELLOW)
+        download_release_asset(download_url, "YTGet_new.py", sha256)
+        return True
     except Exception as e:
-        print_colored(f"Error downloading latest version: {e}", Colors.LIGHT_RED)
+        report(f"Error downloading latest version: {e}", Colors.LIGHT_RED)
+        return False
 
 # Function to get the local version of YTGet
 def get_local_version_youtube():
@@ -77,71 +179,674 @@ def update_and_restart_youtube():
     latest_version = get_latest_version_youtube()
     if latest_version:
         print_colored("Downloading the latest version of YTGet...", Colors.LIGHT_CYAN)
-        download_latest_version_youtube(latest_version)
+        if not download_latest_version_youtube(latest_version):
+            return
+        # Keep a copy of the running version, then swap the new one in without a moment where YTGet.py is missing
+        shutil.copy2('YTGet.py', 'YTGet_old.py')
+        os.replace('YTGet_new.py', 'YTGet.py')
         print_colored("Update completed. Restart the program to access the newest version.", Colors.LIGHT_GREEN)
-        os.rename('YTGet.py', 'YTGet_old.py')
-        os.rename('YTGet_new.py', 'YTGet.py')
     else:
         print_colored("Update failed. Latest version could not be fetched.", Colors.LIGHT_RED)
 
 # Function to get the latest version from GitHub for yt-dlp
-def get_latest_version_yt_dlp():
-    url = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
+def get_latest_version_yt_dlp(report=print_colored):
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
-            return data['tag_name']
+        return fetch_release_metadata("https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest")['tag_name']
     except Exception as e:
-        print_colored(f"Error fetching yt-dlp latest version: {e}", Colors.LIGHT_RED)
+        report(f"Error fetching yt-dlp latest version: {e}", Colors.LIGHT_RED)
         return None
 
-# Function to download the latest yt-dlp executable
-def download_latest_version_yt_dlp(latest_version):
+# Function to get the SHA-256 of a yt-dlp release file, from the API or else from the release's SHA2-256SUMS file
+def get_yt_dlp_sha256(latest_version, asset_name):
+    import urllib.request
+    sha256 = get_release_asset_sha256('yt-dlp/yt-dlp', latest_version, asset_name)
+    if sha256:
+        return sha256
+    sums_url = f"https://github.com/yt-dlp/yt-dlp/releases/download/{latest_version}/SHA2-256SUMS"
+    with urllib.request.urlopen(sums_url, timeout=NETWORK_TIMEOUT) as response:
+        for line in response.read().decode().splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].lstrip('*') == asset_name:
+                return parts[0]
+    return None
+
+# Function to download the latest yt-dlp executable. Returns True when it was downloaded and verified.
+def download_latest_version_yt_dlp(latest_version, report=print_colored):
     download_url = f"https://github.com/yt-dlp/yt-dlp/releases/download/{latest_version}/yt-dlp.exe"
     try:
-        with urllib.request.urlopen(download_url) as response, open("yt-dlp.exe", "wb") as out_file:
-            out_file.write(response.read())
+        sha256 = get_yt_dlp_sha256(latest_version, 'yt-dlp.exe')
+        if not sha256:
+            report("No checksum is published for this yt-dlp release. The download cannot be verified.", Colors.LIGHT_YELLOW)
+        download_release_asset(download_url, "yt-dlp.exe", sha256)
+        return True
     except Exception as e:
-        print_colored(f"Error downloading yt-dlp: {e}", Colors.LIGHT_RED)
+        report(f"Error downloading yt-dlp: {e}", Colors.LIGHT_RED)
+        return False
+
+# yt-dlp executable used for every call. Set "yt_dlp_path" in the config or the YTGET_YT_DLP
+# environment variable to use another build or a stand-in such as bench/fake_yt_dlp.py.
+yt_dlp_path = 'yt-dlp.exe'
+
+# Function to get the command that starts yt-dlp
+def get_yt_dlp_command():
+    path = os.environ.get('YTGET_YT_DLP') or yt_dlp_path
+    if path.endswith('.py'):
+        return [sys.executable, path]
+    return [path]
+
+# Backend used for yt-dlp calls: 'subprocess' runs the executable, 'library' runs yt_dlp in-process
+yt_dlp_backend = 'subprocess'
+# Idle YoutubeDL instances kept per option set, so their HTTP connections stay warm between items
+LIBRARY_POOL_SIZE = 8
+youtube_dl_pool = {}
+youtube_dl_pool_lock = threading.Lock()
+
+# Function to check whether yt-dlp calls should run in-process
+def use_library_backend():
+    return yt_dlp is not None and yt_dlp_backend == 'library'
+
+# Parallel connections per download: fragments of DASH/HLS streams are fetched concurrently, and an
+# external downloader such as aria2c splits plain HTTP files into ranges. Partial files are kept
+# between attempts, so a retry continues from the last completed chunk.
+download_connections = 4
+external_downloader = None
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+
+# Function to set the parallel connection count and external downloader, skipping a downloader that is not installed
+def set_transfer_options(connections, downloader):
+    global download_connections, external_downloader
+    download_connections = max(1, int(connections))
+    if downloader and not shutil.which(downloader):
+        print_colored(f"{downloader} was not found. Downloading with yt-dlp's own downloader.", Colors.LIGHT_YELLOW)
+        downloader = None
+    external_downloader = downloader
+
+# Function to get the yt-dlp command line options for chunked, resumable transfers
+def get_transfer_arguments():
+    arguments = ['--concurrent-fragments', str(download_connections), '--http-chunk-size', str(HTTP_CHUNK_SIZE), '--continue']
+    if external_downloader:
+        arguments += ['--downloader', external_downloader]
+        if external_downloader == 'aria2c':
+            arguments += ['--downloader-args', f"aria2c:-x {download_connections} -s {download_connections} -k 1M"]
+    return arguments
+
+# Function to get the same transfer options as YoutubeDL parameters for the library backend
+def get_transfer_params():
+    params = {'concurrent_fragment_downloads': download_connections, 'http_chunk_size': HTTP_CHUNK_SIZE, 'continuedl': True}
+    if external_downloader:
+        params['external_downloader'] = {'default': external_downloader}
+        if external_downloader == 'aria2c':
+            params['external_downloader_args'] = {
+                'aria2c': ['-x', str(download_connections), '-s', str(download_connections), '-k', '1M'],
+            }
+    return params
+
+# Routes the messages of an in-process YoutubeDL to the console or keeps only its errors
+class LibraryLogger:
+    def __init__(self):
+        self.quiet = True
+        self.last_error = None
+
+    def debug(self, message):
+        if not self.quiet and not message.startswith('[debug] '):
+            print(f"\r\033[K{message}")
+
+    def info(self, message):
+        self.debug(message)
+
+    def warning(self, message):
+        if not self.quiet:
+            print_colored(f"\r\033[K{message}", Colors.LIGHT_YELLOW)
+
+    def error(self, message):
+        self.last_error = message
+        if not self.quiet:
+            print_colored(f"\r\033[K{message}", Colors.LIGHT_RED)
+
+# A YoutubeDL instance from the pool together with the callbacks of the call currently using it
+class PooledYoutubeDL:
+    def __init__(self, options):
+        self.logger = LibraryLogger()
+        self.on_progress = None
+        self.quiet = True
+        self.ydl = yt_dlp.YoutubeDL(dict(options, logger=self.logger, progress_hooks=[self.report_progress],
+                                         noprogress=True, quiet=True))
+
+    def prepare(self, quiet=True, on_progress=None):
+        self.quiet = quiet
+        self.on_progress = on_progress
+        self.logger.quiet = quiet
+        self.logger.last_error = None
+
+    def report_progress(self, progress):
+        event = progress_event(progress)
+        if self.on_progress:
+            self.on_progress(event)
+        if not self.quiet:
+            print_progress_event(event)
+
+# Function to borrow a YoutubeDL instance built with the given options, creating one if none is idle
+def checkout_youtube_dl(options):
+    key = json.dumps(options, sort_keys=True)
+    with youtube_dl_pool_lock:
+        idle = youtube_dl_pool.get(key)
+        if idle:
+            return key, idle.pop()
+    return key, PooledYoutubeDL(options)
+
+# Function to return a borrowed YoutubeDL instance to the pool
+def checkin_youtube_dl(key, pooled):
+    pooled.prepare()
+    with youtube_dl_pool_lock:
+        idle = youtube_dl_pool.setdefault(key, [])
+        if len(idle) < LIBRARY_POOL_SIZE:
+            idle.append(pooled)
+            return
+    pooled.ydl.close()
+
+# Function to extract video metadata in-process, returning the same JSON as yt-dlp -J
+def library_extract_info(url, options):
+    key, pooled = checkout_youtube_dl(options)
+    try:
+        info = pooled.ydl.extract_info(url, download=False)
+        return pooled.ydl.sanitize_info(info)
+    finally:
+        checkin_youtube_dl(key, pooled)
+
+# Function to run one download in-process. Returns the exit code and last error, like run_yt_dlp_download.
+def run_library_download(options, url, info_json=None, on_progress=None, quiet=False, rate_limit=None):
+    key, pooled = checkout_youtube_dl(options)
+    pooled.prepare(quiet, on_progress)
+    # The rate limit is read when each download starts, so it can change without a new instance
+    pooled.ydl.params['ratelimit'] = rate_limit
+    try:
+        if info_json:
+            returncode = pooled.ydl.download_with_info_file(info_json)
+        else:
+            returncode = pooled.ydl.download([url])
+        return returncode, pooled.logger.last_error
+    except yt_dlp.utils.DownloadError as e:
+        return 1, pooled.logger.last_error or str(e)
+    finally:
+        checkin_youtube_dl(key, pooled)
 
 # Function to get the local version of yt-dlp
 def get_local_version_yt_dlp():
-    if not os.path.exists('yt-dlp.exe'):
+    if use_library_backend():
+        return yt_dlp.version.__version__
+    path = os.environ.get('YTGET_YT_DLP') or yt_dlp_path
+    if not os.path.exists(path) and not shutil.which(path):
         return None
-    result = subprocess.run(['yt-dlp.exe', '--version'], capture_output=True, text=True)
+    result = subprocess.run(get_yt_dlp_command() + ['--version'], capture_output=True, text=True, timeout=NETWORK_TIMEOUT * 6)
     return result.stdout.strip()
 
+# On-disk cache of extracted video metadata, so the same URL is not extracted twice
+FORMAT_CACHE_DIR = 'YTGet_Cache'
+# Stream URLs inside a YouTube info JSON expire after about six hours
+FORMAT_CACHE_TTL = 4 * 3600
+FORMAT_CACHE_MAX_BYTES = 100 * 1024 * 1024
+format_cache_db = None
+format_cache_lock = threading.RLock()
+
+# Formats that are never worth offering (storyboards, DRC audio and legacy muxed streams)
+EXCLUDED_FORMAT_IDS = {"18", "233", "234"}
+
+# Function to normalize a URL into a cache key, using the video id for YouTube links
+def normalize_video_url(url):
+    parsed = urllib.parse.urlparse(url.strip())
+    host = get_url_host(url)
+    if host == 'youtube.com':
+        video_id = urllib.parse.parse_qs(parsed.query).get('v', [None])[0]
+        if not video_id and parsed.path.startswith(('/shorts/', '/live/', '/embed/')):
+            video_id = parsed.path.split('/')[2]
+        if not video_id and (parsed.hostname or '').endswith('youtu.be'):
+            video_id = parsed.path.lstrip('/')
+        if video_id:
+            return f"youtube:{video_id}"
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed.query)))
+    return f"{host}{parsed.path.rstrip('/')}" + (f"?{query}" if query else "")
+
+# Function to open the format cache index, an SQLite table so a lookup reads and touches a single entry
+def get_format_cache_db():
+    global format_cache_db
+    with format_cache_lock:
+        if format_cache_db is None:
+            os.makedirs(FORMAT_CACHE_DIR, exist_ok=True)
+            format_cache_db = sqlite3.connect(os.path.join(FORMAT_CACHE_DIR, 'index.db'), check_same_thread=False,
+                                              isolation_level=None)
+            format_cache_db.row_factory = sqlite3.Row
+            format_cache_db.execute("PRAGMA journal_mode=WAL")
+            format_cache_db.execute("PRAGMA synchronous=NORMAL")
+            format_cache_db.execute("""
+                CREATE TABLE IF NOT EXISTS formats (
+                    key TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    info_file TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    formats TEXT NOT NULL
+                )""")
+            format_cache_db.execute("CREATE INDEX IF NOT EXISTS formats_last_used ON formats (last_used)")
+            import_format_cache_index(format_cache_db)
+        return format_cache_db
+
+# Function to move the index.json of older versions into the format cache database
+def import_format_cache_index(db):
+    index_path = os.path.join(FORMAT_CACHE_DIR, 'index.json')
+    try:
+        with open(index_path, 'r') as index_file:
+            index = json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        return
+    db.executemany("INSERT OR IGNORE INTO formats VALUES (?, ?, ?, ?, ?, ?)",
+                   [(key, entry["fetched_at"], entry["last_used"], entry["info_file"], entry["size"],
+                     json.dumps(entry["formats"])) for key, entry in index.items()])
+    os.remove(index_path)
+
+# Function to drop a cache entry together with its info JSON
+def remove_format_cache_entry(db, key, info_file):
+    db.execute("DELETE FROM formats WHERE key = ?", (key,))
+    try:
+        os.remove(os.path.join(FORMAT_CACHE_DIR, info_file))
+    except FileNotFoundError:
+        pass
+
+# Function to look up a fresh cache entry for a URL, marking it as recently used
+def get_cached_formats(url):
+    key = normalize_video_url(url)
+    with format_cache_lock:
+        db = get_format_cache_db()
+        row = db.execute("SELECT fetched_at, info_file, formats FROM formats WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row["fetched_at"] > FORMAT_CACHE_TTL:
+            remove_format_cache_entry(db, key, row["info_file"])
+            return None
+        db.execute("UPDATE formats SET last_used = ? WHERE key = ?", (time.time(), key))
+        return {"fetched_at": row["fetched_at"], "info_file": row["info_file"], "formats": json.loads(row["formats"])}
+
+# Function to get the cached info JSON for a URL, so yt-dlp can skip extraction
+def get_cached_info_json(url):
+    entry = get_cached_formats(url)
+    if entry is None:
+        return None
+    info_path = os.path.join(FORMAT_CACHE_DIR, entry["info_file"])
+    return info_path if os.path.exists(info_path) else None
+
+# Function to turn yt-dlp's format dictionaries into compact records
+def parse_format_records(info):
+    records = []
+    for fmt in info.get('formats') or []:
+        format_id = str(fmt.get('format_id', ''))
+        if format_id in EXCLUDED_FORMAT_IDS or fmt.get('ext') == 'mhtml' or 'drc' in format_id:
+            continue
+        records.append({
+            "format_id": format_id,
+            "ext": fmt.get('ext'),
+            "resolution": fmt.get('resolution') or ('audio only' if fmt.get('vcodec') == 'none' else None),
+            "height": fmt.get('height'),
+            "fps": fmt.get('fps'),
+            "vcodec": fmt.get('vcodec'),
+            "acodec": fmt.get('acodec'),
+            "filesize": fmt.get('filesize') or fmt.get('filesize_approx'),
+            "tbr": fmt.get('tbr'),
+            "protocol": fmt.get('protocol'),
+            "note": fmt.get('format_note'),
+        })
+    return records
+
+# Function to store extracted metadata in the cache, evicting the least recently used entries
+def store_format_cache(url, info):
+    key = normalize_video_url(url)
+    records = parse_format_records(info)
+    info_file = hashlib.sha1(key.encode()).hexdigest() + '.info.json'
+    with format_cache_lock:
+        db = get_format_cache_db()
+        with open(os.path.join(FORMAT_CACHE_DIR, info_file), 'w') as out_file:
+            json.dump(info, out_file)
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO formats VALUES (?, ?, ?, ?, ?, ?)",
+                   (key, now, now, info_file, os.path.getsize(os.path.join(FORMAT_CACHE_DIR, info_file)), json.dumps(records)))
+        total_size = db.execute("SELECT COALESCE(SUM(size), 0) FROM formats").fetchone()[0]
+        if total_size > FORMAT_CACHE_MAX_BYTES:
+            for old_key, old_info_file, size in db.execute(
+                    "SELECT key, info_file, size FROM formats WHERE key != ? ORDER BY last_used", (key,)).fetchall():
+                if total_size <= FORMAT_CACHE_MAX_BYTES:
+                    break
+                total_size -= size
+                remove_format_cache_entry(db, old_key, old_info_file)
+    return records
+
+# Function to render format records as a table similar to yt-dlp -F
+def format_records_table(records):
+    def size_text(size):
+        return format_bytes(size) if size else ""
+
+    lines = [f"{'ID':<10} {'EXT':<5} {'RESOLUTION':<11} {'FPS':>3} | {'FILESIZE':>10} {'TBR':>6} {'PROTO':<6} | {'VCODEC':<14} {'ACODEC':<10} MORE INFO"]
+    for record in records:
+        lines.append(
+            f"{record['format_id']:<10} {record['ext'] or '':<5} {record['resolution'] or '':<11} {record['fps'] or '':>3} | "
+            f"{size_text(record['filesize']):>10} {(str(round(record['tbr'])) + 'k') if record['tbr'] else '':>6} "
+            f"{(record['protocol'] or '')[:6]:<6} | {record['vcodec'] or '':<14} {record['acodec'] or '':<10} {record['note'] or ''}"
+        )
+    return f"{Colors.LIGHT_YELLOW}" + "\n".join(lines) + Colors.RESET
+
+# Columns of the format table used by the format selector
+FORMAT_TABLE_COLUMNS = ('format_id', 'ext', 'height', 'vcodec', 'acodec', 'filesize', 'tbr', 'protocol')
+# Short codec names accepted in format rules, mapped to the prefixes yt-dlp reports
+CODEC_ALIASES = {'av1': ('av01',), 'av01': ('av01',), 'vp9': ('vp9', 'vp09'), 'h264': ('avc1',), 'avc': ('avc1',),
+                 'avc1': ('avc1',), 'h265': ('hvc1', 'hev1'), 'hevc': ('hvc1', 'hev1'), 'opus': ('opus',),
+                 'aac': ('mp4a',), 'm4a': ('mp4a',), 'mp4a': ('mp4a',)}
+
+# Function to turn format records into columns, one list per field, so the selector filters whole columns at once
+def build_format_table(records):
+    table = {column: [] for column in FORMAT_TABLE_COLUMNS}
+    for record in records:
+        for column in FORMAT_TABLE_COLUMNS:
+            table[column].append(record.get(column))
+        # Cache entries written before heights were stored only have the "WxH" resolution
+        if table['height'][-1] is None and 'x' in (record.get('resolution') or ''):
+            table['height'][-1] = int(record['resolution'].split('x')[1])
+    return table
+
+# Function to parse a format rule such as "<=1080p, prefer=av01|vp9, smallest"
+def parse_format_rule(rule):
+    parsed = {"max_height": None, "min_height": None, "vcodecs": [], "acodecs": [], "container": None,
+              "smallest": False, "audio_only": False}
+    for term in rule.lower().split(','):
+        term = term.strip()
+        if not term:
+            continue
+        bound = re.fullmatch(r'(<=|>=|<|>)\s*(\d+)p?', term)
+        if bound:
+            operator, height = bound.group(1), int(bound.group(2))
+            if operator.startswith('<'):
+                parsed["max_height"] = height if operator == '<=' else height - 1
+            else:
+                parsed["min_height"] = height if operator == '>=' else height + 1
+        elif term.startswith('prefer='):
+            parsed["vcodecs"] = [codec.strip() for codec in term[len('prefer='):].split('|') if codec.strip()]
+        elif term.startswith('audio='):
+            parsed["acodecs"] = [codec.strip() for codec in term[len('audio='):].split('|') if codec.strip()]
+        elif term.startswith('container='):
+            parsed["container"] = term[len('container='):].strip()
+        elif term in ('smallest', 'largest'):
+            parsed["smallest"] = term == 'smallest'
+        elif term in ('audio-only', 'audio only', 'audio'):
+            parsed["audio_only"] = True
+        else:
+            raise ValueError(f"Unknown format rule term: {term}")
+    return parsed
+
+# Function to check whether text is a format rule rather than a yt-dlp format code
+def is_format_rule(text):
+    try:
+        parsed = parse_format_rule(text)
+    except ValueError:
+        return False
+    return parsed != parse_format_rule('')
+
+# Function to rank a codec against a preference list (lower is better, unlisted codecs come last)
+def codec_rank(codec, preferences):
+    codec = codec or ''
+    for rank, preference in enumerate(preferences):
+        if codec.startswith(CODEC_ALIASES.get(preference, (preference,))):
+            return rank
+    return len(preferences)
+
+# Function to pick format codes from format records by rule, without asking. Returns None when nothing matches.
+# Video is chosen by highest height within the bounds, then codec preference, then size (largest unless "smallest").
+def select_format(records, rule):
+    parsed = parse_format_rule(rule) if isinstance(rule, str) else rule
+    table = build_format_table(records)
+    rows = range(len(table['format_id']))
+    has_video = [(vcodec or 'none') != 'none' for vcodec in table['vcodec']]
+    has_audio = [(acodec or 'none') != 'none' for acodec in table['acodec']]
+    size = [filesize or (tbr or 0) * 1000 for filesize, tbr in zip(table['filesize'], table['tbr'])]
+
+    audio_rows = [row for row in rows if has_audio[row] and not has_video[row]]
+    audio_preferences = parsed["acodecs"] or (['aac'] if parsed["container"] == 'mp4' else [])
+    best_audio = min(audio_rows, default=None,
+                     key=lambda row: (codec_rank(table['acodec'][row], audio_preferences), -(table['tbr'][row] or 0)))
+    if parsed["audio_only"]:
+        return table['format_id'][best_audio] if best_audio is not None else None
+
+    def video_key(row):
+        return (-(table['height'][row] or 0), codec_rank(table['vcodec'][row], parsed["vcodecs"]),
+                size[row] if parsed["smallest"] else -size[row])
+
+    video_rows = [row for row in rows if has_video[row]
+                  and (parsed["max_height"] is None or (table['height'][row] or 0) <= parsed["max_height"])
+                  and (parsed["min_height"] is None or (table['height'][row] or 0) >= parsed["min_height"])
+                  and (parsed["container"] is None or table['ext'][row] == parsed["container"])]
+    # Prefer a separate video stream merged with the best audio, and fall back to formats that carry both
+    video_only = [row for row in video_rows if not has_audio[row]]
+    if video_only and best_audio is not None:
+        return f"{table['format_id'][min(video_only, key=video_key)]}+{table['format_id'][best_audio]}"
+    muxed = [row for row in video_rows if has_audio[row]]
+    return table['format_id'][min(muxed, key=video_key)] if muxed else None
+
+# Function to get the format records of a URL from the cache, extracting and caching them when missing
+def get_format_records(url):
+    entry = get_cached_formats(url)
+    if entry is not None:
+        return entry["formats"]
+    if use_library_backend():
+        return store_format_cache(url, library_extract_info(url, {'noplaylist': True}))
+    result = subprocess.run(get_yt_dlp_command() + ['-J', '--no-playlist', url], capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"yt-dlp exited with {result.returncode}"
+        raise RuntimeError(error)
+    return store_format_cache(url, json.loads(result.stdout))
+
 # Function to fetch available formats for a given URL
 def get_available_formats(url):
     try:
-        result = subprocess.run(['yt-dlp.exe', '-F', url], capture_output=True, text=True)
-        formats = result.stdout
-        excluded_formats = ["sb2", "sb3", "sb1", "sb0", "drc", "18", "sb3 mhtml", "sb2 mhtml", "sb1 mhtml", "sb0 mhtml", "233 mp4", "234 mp4", "18  mp4", "233", "234"]
-        excluded_lines = [
-            "Extracting URL",
-            "Downloading webpage",
-            "Downloading ios player API JSON",
-            "Downloading m3u8 information"
-        ]
-        lines = formats.splitlines()
-        filtered_lines = [
-            line for line in lines 
-            if not any(ex_line in line for ex_line in excluded_lines) and not any(exf in line for exf in excluded_formats)
-        ]
-        return f"{Colors.LIGHT_YELLOW}\n".join(filtered_lines) + Colors.RESET
+        return format_records_table(get_format_records(url))
     except Exception as e:
         print_colored(f"Error fetching available formats: {e}", Colors.LIGHT_RED)
         return ""
 
-# Function to download video with the specified format
-def download_video(url, format_code, download_path, max_retries=10):
-    if not url or not format_code or not download_path:
-        print_colored("URL, format code, or download path cannot be empty.", Colors.LIGHT_RED)
-        return False
+# Function to pick format codes for many URLs by rule, extracting them in parallel. Returns {url: code or None}.
+def select_formats(urls, rule, max_workers=3):
+    parsed = parse_format_rule(rule)
 
-    os.makedirs(download_path, exist_ok=True)
-    retries = 0
+    def select(url):
+        try:
+            return select_format(get_format_records(url), parsed)
+        except Exception as e:
+            print_colored(f"Error fetching available formats for {url}: {e}", Colors.LIGHT_RED)
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        return dict(zip(urls, executor.map(select, urls)))
+
+# Completed downloads are recorded in yt-dlp --download-archive files, one file per format code,
+# so the same video can still be fetched once as audio and once as video
+ARCHIVE_DIR = 'YTGet_Archive'
+download_archives = {}
+download_archive_lock = threading.Lock()
+
+# Function to get the archive file that records downloads made with a format code
+def get_archive_path(format_code):
+    file_name = ''.join(char if char.isalnum() or char in '+-._' else '_' for char in format_code)
+    return os.path.join(ARCHIVE_DIR, f"{file_name}.txt")
+
+# Function to get the in-memory index of an archive file, loading it on first use
+def get_download_archive(format_code):
+    with download_archive_lock:
+        archive = download_archives.get(format_code)
+        if archive is None:
+            archive = set()
+            try:
+                with open(get_archive_path(format_code), 'r', encoding='utf-8') as archive_file:
+                    archive.update(line.strip() for line in archive_file if line.strip())
+            except FileNotFoundError:
+                pass
+            download_archives[format_code] = archive
+        return archive
+
+# Function to get the "extractor id" archive entry of a URL or flat playlist entry without running yt-dlp.
+# Returns None when the id cannot be told from the URL alone.
+def get_archive_id(url, video_data=None):
+    if video_data and video_data.get('ie_key') and video_data.get('id'):
+        return f"{video_data['ie_key'].lower()} {video_data['id']}"
+    key = normalize_video_url(url)
+    if key.startswith('youtube:'):
+        return f"youtube {key[len('youtube:'):]}"
+    return None
+
+# Function to check whether a video was already downloaded in a format
+def is_in_download_archive(url, format_code, video_data=None):
+    archive_id = get_archive_id(url, video_data)
+    return archive_id is not None and archive_id in get_download_archive(format_code)
+
+# Function to add a finished download to the in-memory index. yt-dlp writes the archive file itself,
+# unless it was run without one (write=True), as for downloads that are post-processed afterwards.
+def record_in_download_archive(url, format_code, video_data=None, write=False):
+    archive_id = get_archive_id(url, video_data)
+    if archive_id is not None:
+        archive = get_download_archive(format_code)
+        with download_archive_lock:
+            if write and archive_id not in archive:
+                os.makedirs(ARCHIVE_DIR, exist_ok=True)
+                with open(get_archive_path(format_code), 'a', encoding='utf-8') as archive_file:
+                    archive_file.write(f"{archive_id}\n")
+            archive.add(archive_id)
+
+# yt-dlp prints every progress update as one JSON line behind this marker
+PROGRESS_PREFIX = 'YTGet-Progress '
+PROGRESS_OPTIONS = ['--newline', '--progress', '--progress-template', f'download:{PROGRESS_PREFIX}%(progress)j']
+
+# Function to parse a progress line from yt-dlp into a progress event
+def parse_progress_line(line):
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        progress = json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+    return progress_event(progress)
+
+# Function to turn a yt-dlp progress dictionary into a progress event
+def progress_event(progress):
+    return {
+        "status": progress.get("status"),
+        "filename": progress.get("filename"),
+        "downloaded_bytes": progress.get("downloaded_bytes") or 0,
+        "total_bytes": progress.get("total_bytes") or progress.get("total_bytes_estimate"),
+        "speed": progress.get("speed"),
+        "eta": progress.get("eta"),
+        "fragment_index": progress.get("fragment_index"),
+        "fragment_count": progress.get("fragment_count"),
+    }
+
+# Collects the progress events of one download into throughput figures
+class DownloadStats:
+    def __init__(self):
+        self.start_time = time.time()
+        # Bytes per file, so the video and audio streams of a merged download are both counted
+        self.file_bytes = {}
+        self.speed = None
+        self.eta = None
+        self.fragment_count = None
+
+    def __call__(self, event):
+        if event["status"] == 'finished':
+            self.file_bytes[event["filename"]] = event["total_bytes"] or event["downloaded_bytes"]
+        else:
+            self.file_bytes[event["filename"]] = event["downloaded_bytes"]
+        self.speed = event["speed"]
+        self.eta = event["eta"]
+        if event["fragment_count"]:
+            self.fragment_count = event["fragment_count"]
 
+    def downloaded_bytes(self):
+        return sum(self.file_bytes.values())
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        downloaded = self.downloaded_bytes()
+        return {
+            "downloaded_bytes": downloaded,
+            "elapsed": round(elapsed, 3),
+            "average_speed": round(downloaded / elapsed) if elapsed > 0 else None,
+            "fragment_count": self.fragment_count,
+        }
+
+# Function to draw a single progress line for a download running in the foreground
+def print_progress_event(event):
+    total = event["total_bytes"]
+    percent = f"{event['downloaded_bytes'] / total * 100:5.1f}%" if total else "  ?  %"
+    line = f"{percent} of {format_bytes(total) if total else '?'}"
+    if event["speed"]:
+        line += f" at {format_bytes(event['speed'])}/s"
+    if event["eta"] is not None:
+        line += f" ETA {int(event['eta'])}s"
+    if event["fragment_count"]:
+        line += f" (frag {event['fragment_index']}/{event['fragment_count']})"
+    sys.stdout.write(f"\r\033[K{Colors.LIGHT_CYAN}{line}{Colors.RESET}")
+    if event["status"] == 'finished':
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+# Function to run one yt-dlp download, streaming its progress events. Returns the exit code and last error line.
+def run_yt_dlp_download(command, on_progress=None, quiet=False):
+    if quiet:
+        command = command + ['--quiet']
+    process = subprocess.Popen(command + PROGRESS_OPTIONS, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding='utf-8', errors='replace')
+    last_error = None
+    for line in process.stdout:
+        line = line.rstrip()
+        event = parse_progress_line(line)
+        if event is not None:
+            if on_progress:
+                on_progress(event)
+            if not quiet:
+                print_progress_event(event)
+            continue
+        if line.startswith('ERROR:'):
+            last_error = line
+        if not quiet and line:
+            print(f"\r\033[K{line}")
+    return process.wait(), last_error
+
+# yt-dlp error messages that tell why a download failed, checked in order
+DOWNLOAD_ERROR_PATTERNS = [
+    ('rate_limited', ('HTTP Error 429', 'Too Many Requests', 'rate-limit', 'rate limit', "confirm you're not a bot")),
+    ('permanent', ('Video unavailable', 'Private video', 'has been removed', 'account associated with this video has been terminated',
+                   'not available in your country', 'geo restrict', 'Unsupported URL', 'Requested format is not available',
+                   'confirm your age', 'members-only', 'copyright', 'HTTP Error 404', 'is not a valid URL', 'This live event will begin',
+                   'No space left on device')),
+    ('fragment', ('fragment', 'Did not get any data blocks', 'giving up after')),
+    ('network', ('timed out', 'Connection reset', 'Connection refused', 'Connection aborted', 'Temporary failure in name resolution',
+                 'getaddrinfo failed', 'Unable to download', 'IncompleteRead', 'HTTP Error 5', 'Network is unreachable')),
+]
+# Base delay in seconds before the first retry of each kind of failure
+RETRY_BASE_DELAYS = {'rate_limited': 60, 'fragment': 5, 'network': 10, 'transient': 5}
+RETRY_MAX_DELAY = 900
+
+# Function to classify a failed yt-dlp run as permanent, rate_limited, fragment, network or transient
+def classify_download_error(returncode, error):
+    # Exit code 2 means yt-dlp rejected its options, which no retry will fix
+    if returncode == 2:
+        return 'permanent'
+    error = str(error or '')
+    for error_class, patterns in DOWNLOAD_ERROR_PATTERNS:
+        if any(pattern.lower() in error.lower() for pattern in patterns):
+            return error_class
+    return 'transient'
+
+# Function to get how long to wait before retry number `attempt`, with jitter so workers do not retry in lockstep
+def get_retry_delay(error_class, attempt):
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAYS.get(error_class, 5) * 2 ** max(0, attempt - 1))
+    return delay * random.uniform(0.5, 1.5)
+
+# Function to run a single download attempt. Returns (success, error class, error message).
+# With archive=False the download is not recorded, so a post-processing step can record it once it is done.
+def attempt_download(url, format_code, download_path, quiet=False, on_progress=None, use_info_json=True, rate_limit=None,
+                     output_template='%(title)s.%(ext)s', archive=True):
     # Check if cookies.txt exists and set the command accordingly
     cookie_file = 'cookies.txt'
     if os.path.exists(cookie_file):
@@ -149,136 +854,1269 @@ def download_video(url, format_code, download_path, max_retries=10):
     else:
         cookie_option = []
 
-    while retries < max_retries:
-        try:
-            # Include the cookies option in the yt-dlp command
-            result = subprocess.run(['yt-dlp.exe', '-f', format_code, url, '-o', os.path.join(download_path, '%(title)s.%(ext)s')] + cookie_option)
-            if result.returncode == 0:
-                return True
-        except Exception as e:
-            print_colored(f"Error during video download: {e}", Colors.LIGHT_RED)
-        retries += 1
+    # Reuse metadata from the format cache so the page is not extracted a second time
+    info_json = get_cached_info_json(url) if use_info_json else None
+    output_template = os.path.join(download_path, output_template)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    try:
+        if use_library_backend():
+            options = dict(get_transfer_params(), format=format_code, outtmpl=output_template)
+            if archive:
+                options['download_archive'] = get_archive_path(format_code)
+            if cookie_option:
+                options['cookiefile'] = cookie_file
+            returncode, error = run_library_download(options, url, info_json, on_progress, quiet, rate_limit)
+        else:
+            output_option = ['-o', output_template] + get_transfer_arguments()
+            if archive:
+                output_option += ['--download-archive', get_archive_path(format_code)]
+            if rate_limit:
+                output_option += ['--limit-rate', str(int(rate_limit))]
+            if info_json:
+                command = get_yt_dlp_command() + ['-f', format_code, '--load-info-json', info_json] + output_option + cookie_option
+            else:
+                command = get_yt_dlp_command() + ['-f', format_code, url] + output_option + cookie_option
+            returncode, error = run_yt_dlp_download(command, on_progress, quiet)
+    except Exception as e:
+        # A yt-dlp executable that is missing or cannot be run fails every attempt the same way
+        if isinstance(e, (FileNotFoundError, PermissionError)) and not use_library_backend():
+            return False, 'permanent', f"Cannot run yt-dlp: {e}"
+        return False, classify_download_error(None, str(e)), str(e)
+    if returncode == 0:
+        if archive:
+            record_in_download_archive(url, format_code)
+        return True, None, None
+    error = error or f"yt-dlp exited with code {returncode}"
+    return False, classify_download_error(returncode, error), error
+
+# Function to download video with the specified format
+def download_video(url, format_code, download_path, max_retries=10, quiet=False, on_progress=None, rate_limit=None):
+    if not url or not format_code or not download_path:
+        print_colored("URL, format code, or download path cannot be empty.", Colors.LIGHT_RED)
+        return False
+
+    os.makedirs(download_path, exist_ok=True)
+    error = None
+    for attempt in range(max_retries):
+        # A stale info JSON fails fast, so later attempts go back to the URL
+        success, error_class, error = attempt_download(url, format_code, download_path, quiet, on_progress,
+                                                       use_info_json=attempt == 0, rate_limit=rate_limit)
+        if success:
+            return True
+        if error_class == 'permanent' or attempt == max_retries - 1:
+            break
+        delay = get_retry_delay(error_class, attempt + 1)
+        if not quiet:
+            print_colored(f"Download failed ({error_class}): {error}. Retrying in {delay:.0f}s...", Colors.LIGHT_YELLOW)
+        time.sleep(delay)
+    if quiet and error:
+        print_colored(f"\r\033[K{error}", Colors.LIGHT_RED)
     return False
 
+# Downloads that need ffmpeg are handed to a separate post-processing pool, so the next download starts while
+# ffmpeg works. Steps a queue item can ask for, in the order they run:
+#   merge      mux video and audio downloaded as separate files (implied by plain "video+audio" format codes)
+#   audio      convert to an audio-only file in audio_format
+#   metadata   embed the title, uploader, date and description
+#   thumbnail  embed the video thumbnail (mp4, m4a and mp3 files)
+#   checksum   write a SHA-256 file next to the result
+POSTPROCESS_STEPS = ('merge', 'audio', 'metadata', 'thumbnail', 'checksum')
+ffmpeg_path = 'ffmpeg'
+audio_format = 'mp3'
+AUDIO_CODECS = {'mp3': 'libmp3lame', 'm4a': 'aac', 'aac': 'aac', 'opus': 'libopus', 'flac': 'flac', 'wav': 'pcm_s16le'}
+THUMBNAIL_CONTAINERS = ('mp4', 'm4a', 'mp3')
+AUDIO_EXTENSIONS = ('m4a', 'mp3', 'opus', 'weba', 'aac', 'flac', 'wav', 'ogg')
+# Separately downloaded streams get yt-dlp's own intermediate file names
+SPLIT_OUTPUT_TEMPLATE = '%(title)s.f%(format_id)s.%(ext)s'
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# Function to parse post-processing steps from a list or a comma-separated string, in the order they run
+def parse_postprocess_steps(steps):
+    if isinstance(steps, str):
+        steps = steps.split(',')
+    steps = {step.strip().lower() for step in steps or [] if step.strip()}
+    for step in steps:
+        if step not in POSTPROCESS_STEPS:
+            raise ValueError(f"Unknown post-processing step: {step}")
+    return [step for step in POSTPROCESS_STEPS if step in steps]
+
+# Function to split a plain "video+audio" format code into format codes that yt-dlp downloads as separate files.
+# Returns None for codes with fallbacks or filters, which yt-dlp keeps merging itself.
+def split_format_code(format_code):
+    parts = format_code.split('+')
+    if len(parts) < 2 or any(not part or any(char in part for char in '/,[]()') for part in parts):
+        return None
+    return parts
+
+# Function to check whether ffmpeg can be run
+def is_ffmpeg_available():
+    return bool(shutil.which(ffmpeg_path) or os.path.exists(ffmpeg_path))
+
+# Function to get the metadata of a video from the format cache, extracting it when it is not cached
+def get_video_info(url):
+    info_json = get_cached_info_json(url)
+    if info_json is None:
+        get_format_records(url)
+        info_json = get_cached_info_json(url)
+    with open(info_json, 'r', encoding='utf-8') as info_file:
+        return json.load(info_file)
+
+# Function to get the tags the metadata step embeds
+def get_metadata_tags(info):
+    tags = {
+        "title": info.get('title'),
+        "artist": info.get('artist') or info.get('uploader'),
+        "album": info.get('album'),
+        "date": info.get('upload_date'),
+        "description": info.get('description'),
+        "comment": info.get('webpage_url'),
+    }
+    return {key: value for key, value in tags.items() if value}
+
+# Function to download the thumbnail of a video next to its output. Returns None when it has none.
+def download_thumbnail(info, base):
+    import urllib.request
+    url = info.get('thumbnail')
+    if not url:
+        return None
+    path = base + '.thumbnail' + (os.path.splitext(urllib.parse.urlparse(url).path)[1] or '.jpg')
+    with urllib.request.urlopen(url, timeout=30) as response, open(path, 'wb') as thumbnail_file:
+        shutil.copyfileobj(response, thumbnail_file)
+    return path
+
+# Function to count the downloaded files that hold a video stream, from the format records of split streams
+# and from the file extension otherwise
+def count_video_streams(files, info):
+    vcodecs = {fmt.get('format_id'): fmt.get('vcodec') for fmt in info.get('formats') or []}
+    count = 0
+    for path in files:
+        base, ext = os.path.splitext(path)
+        match = re.search(r'\.f([^.]+)$', base)
+        vcodec = vcodecs.get(match.group(1)) if match else None
+        if vcodec is not None:
+            count += vcodec != 'none'
+        else:
+            count += ext[1:].lower() not in AUDIO_EXTENSIONS
+    return count
+
+# Function to get the output file name of post-processing as (path without extension, extension)
+def get_postprocess_output(files, steps):
+    base, ext = os.path.splitext(files[0])
+    ext = ext[1:]
+    if len(files) > 1:
+        # Drop the ".f137" part of the stream files and pick a container that holds all streams, as yt-dlp does
+        base = re.sub(r'\.f[^.]+$', '', base)
+        extensions = {os.path.splitext(path)[1][1:] for path in files}
+        if extensions <= {'mp4', 'm4a', 'mov'}:
+            ext = 'mp4'
+        elif extensions <= {'webm', 'weba'}:
+            ext = 'webm'
+        else:
+            ext = 'mkv'
+    if 'audio' in steps:
+        ext = audio_format
+    return base, ext
+
+# Function to run the merge, audio, metadata and thumbnail steps as a single ffmpeg pass. Returns the output file.
+def run_ffmpeg_steps(url, files, steps):
+    if not is_ffmpeg_available():
+        raise RuntimeError(f"{ffmpeg_path} was not found, so the download cannot be post-processed")
+    base, ext = get_postprocess_output(files, steps)
+    info = get_video_info(url) if 'metadata' in steps or 'thumbnail' in steps else {}
+    thumbnail = download_thumbnail(info, base) if 'thumbnail' in steps and ext in THUMBNAIL_CONTAINERS else None
+    audio_only = 'audio' in steps
+    command = [ffmpeg_path, '-y', '-nostdin', '-loglevel', 'error']
+    for path in files + ([thumbnail] if thumbnail else []):
+        command += ['-i', path]
+    for index in range(len(files)):
+        command += ['-map', f"{index}:a?" if audio_only else str(index)]
+    command += ['-c:a', AUDIO_CODECS.get(audio_format, 'copy')] if audio_only else ['-c', 'copy']
+    if thumbnail:
+        # The cover follows the video streams that are kept, so it is the only one of an audio file
+        cover = 0 if audio_only else count_video_streams(files, info)
+        command += ['-map', f"{len(files)}:v", f"-c:v:{cover}", 'mjpeg', f"-disposition:v:{cover}", 'attached_pic']
+        if ext == 'mp3':
+            command += ['-id3v2_version', '3']
+    if 'metadata' in steps:
+        for key, value in get_metadata_tags(info).items():
+            command += ['-metadata', f"{key}={value}"]
+    # ffmpeg cannot write over its input, so write next to it and swap the result in
+    output, temp_output = f"{base}.{ext}", f"{base}.temp.{ext}"
+    try:
+        result = subprocess.run(command + [temp_output], capture_output=True, text=True, encoding='utf-8', errors='replace')
+    finally:
+        if thumbnail:
+            os.remove(thumbnail)
+    if result.returncode != 0:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"ffmpeg exited with code {result.returncode}"
+        raise RuntimeError(error)
+    os.replace(temp_output, output)
+    for path in files:
+        if path != output and os.path.exists(path):
+            os.remove(path)
+    return output
+
+# Function to write a sha256sum-compatible checksum file next to a file
+def write_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as data_file:
+        for chunk in iter(lambda: data_file.read(CHECKSUM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    with open(path + '.sha256', 'w', encoding='utf-8') as checksum_file:
+        checksum_file.write(f"{digest.hexdigest()}  {os.path.basename(path)}\n")
+
+# Function to run the post-processing steps of a finished download on its files. Returns (success, error).
+def postprocess_download(url, files, steps):
+    try:
+        output = files[0]
+        ffmpeg_steps = [step for step in steps if step not in ('merge', 'checksum')]
+        if len(files) > 1 or ffmpeg_steps:
+            output = run_ffmpeg_steps(url, files, ffmpeg_steps)
+        if 'checksum' in steps:
+            write_checksum(output)
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+# Function to choose the yt-dlp backend, falling back to the executable when yt_dlp is not installed
+def set_yt_dlp_backend(backend):
+    global yt_dlp_backend, yt_dlp
+    if backend == 'library' and yt_dlp is None:
+        try:
+            import yt_dlp
+        except ImportError:
+            pass
+    if backend == 'library' and yt_dlp is None:
+        print_colored("The yt_dlp package is not installed. Using the yt-dlp executable instead.", Colors.LIGHT_YELLOW)
+        backend = 'subprocess'
+    yt_dlp_backend = backend
+
 # Function to load configuration from a file
 def load_config():
+    global yt_dlp_path, ffmpeg_path, audio_format
     if os.path.exists('YTGet_Conf.json'):
         try:
             with open('YTGet_Conf.json', 'r') as config_file:
                 config = json.load(config_file)
             # Ensure a default timestamp exists if missing
             config.setdefault("last_update_check", 0)
+            config.setdefault("max_workers", 3)
+            config.setdefault("max_per_host", 2)
+            config.setdefault("max_retries", 10)
+            config.setdefault("bandwidth_limit", None)
+            config.setdefault("bandwidth_windows", [])
+            config.setdefault("yt_dlp_path", 'yt-dlp.exe')
+            config.setdefault("yt_dlp_backend", 'subprocess')
+            config.setdefault("connections", 4)
+            config.setdefault("external_downloader", None)
+            config.setdefault("postprocess", [])
+            config.setdefault("postprocess_workers", 2)
+            config.setdefault("audio_format", 'mp3')
+            config.setdefault("ffmpeg_path", 'ffmpeg')
+            config.setdefault("metrics_file", METRICS_FILE)
+            config.setdefault("prometheus_file", PROMETHEUS_FILE)
+            yt_dlp_path = config["yt_dlp_path"]
+            ffmpeg_path = config["ffmpeg_path"]
+            audio_format = config["audio_format"]
+            set_yt_dlp_backend(config["yt_dlp_backend"])
+            set_transfer_options(config["connections"], config["external_downloader"])
+            import_config_queue(config)
             return config
         except Exception as e:
             print_colored(f"Error loading configuration: {e}", Colors.LIGHT_RED)
-    return {"download_path": None, "queue": [], "failed_downloads": [], "last_update_check": 0}
+    return {"download_path": None, "last_update_check": 0, "max_workers": 3, "max_per_host": 2, "max_retries": 10,
+            "bandwidth_limit": None, "bandwidth_windows": [], "yt_dlp_path": 'yt-dlp.exe',
+            "yt_dlp_backend": 'subprocess', "connections": 4, "external_downloader": None, "postprocess": [],
+            "postprocess_workers": 2, "audio_format": 'mp3', "ffmpeg_path": 'ffmpeg', "metrics_file": METRICS_FILE,
+            "prometheus_file": PROMETHEUS_FILE}
 
 # Function to save configuration to a file
 def save_config(config):
-    try:
-        with open('YTGet_Conf.json', 'w') as config_file:
-            json.dump(config, config_file, indent=4)
-    except Exception as e:
-        print_colored(f"Error saving configuration: {e}", Colors.LIGHT_RED)
+    # Write to a temporary file and swap it in, so a crash mid-write never leaves a truncated config
+    with config_lock:
+        try:
+            with open('YTGet_Conf.json.tmp', 'w') as config_file:
+                json.dump(config, config_file, indent=4)
+            os.replace('YTGet_Conf.json.tmp', 'YTGet_Conf.json')
+        except Exception as e:
+            print_colored(f"Error saving configuration: {e}", Colors.LIGHT_RED)
 
-# Function to add a new download to the queue
-def add_download_to_queue(url, format_code, download_path, config):
-    config["queue"].append({"url": url, "format_code": format_code, "download_path": download_path})
+# The queue lives in an SQLite database: appends and state changes are single-row writes,
+# and finished items stay behind as history without slowing down the pending lookups
+QUEUE_DB_FILE = 'YTGet_Queue.db'
+queue_db = None
+queue_db_lock = threading.RLock()
+QUEUE_DB_EXTRA_COLUMNS = {
+    "downloaded_bytes": "INTEGER",
+    "elapsed": "REAL",
+    "average_speed": "REAL",
+    "fragment_count": "INTEGER",
+    "attempts": "INTEGER NOT NULL DEFAULT 0",
+    "partial_bytes": "INTEGER NOT NULL DEFAULT 0",
+    "partial_fragment": "INTEGER",
+    "postprocess": "TEXT NOT NULL DEFAULT ''",
+    "postprocess_files": "TEXT",
+    "postprocess_elapsed": "REAL",
+    "owner": "TEXT",
+    "heartbeat": "REAL",
+}
+# Seconds between saves of a running item's partial progress
+PARTIAL_SAVE_INTERVAL = 5
+# Several queue runs may share the database (the menu and a cron job, say). Each run claims the items it works
+# on under its own owner id and refreshes their heartbeat. Only items whose heartbeat has gone stale, because
+# the run that claimed them stopped, are recovered by another run.
+QUEUE_OWNER = f"{os.getpid()}-{random.getrandbits(32):08x}"
+QUEUE_HEARTBEAT_INTERVAL = 10
+QUEUE_OWNER_TIMEOUT = 60
+
+# Function to open the queue database, creating its schema on first use
+def get_queue_db():
+    global queue_db
+    with queue_db_lock:
+        if queue_db is None:
+            queue_db = sqlite3.connect(QUEUE_DB_FILE, check_same_thread=False, isolation_level=None)
+            queue_db.row_factory = sqlite3.Row
+            queue_db.execute("PRAGMA journal_mode=WAL")
+            queue_db.execute("PRAGMA synchronous=NORMAL")
+            queue_db.execute("""
+                CREATE TABLE IF NOT EXISTS downloads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    format_code TEXT NOT NULL,
+                    download_path TEXT,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    added_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            queue_db.execute("CREATE INDEX IF NOT EXISTS downloads_state ON downloads (state, id)")
+            queue_db.execute("CREATE INDEX IF NOT EXISTS downloads_url ON downloads (url)")
+            # Columns added after the first release of the queue database
+            existing_columns = {row["name"] for row in queue_db.execute("PRAGMA table_info(downloads)")}
+            for column, column_type in QUEUE_DB_EXTRA_COLUMNS.items():
+                if column not in existing_columns:
+                    queue_db.execute(f"ALTER TABLE downloads ADD COLUMN {column} {column_type}")
+        return queue_db
+
+# Function to move the queue of older versions out of YTGet_Conf.json into the queue database
+def import_config_queue(config):
+    pending = config.pop("queue", None) or []
+    failed = config.pop("failed_downloads", None) or []
+    if not pending and not failed:
+        return
+    now = time.time()
+    rows = [(item["url"], item["format_code"], item.get("download_path"), state, now, now)
+            for state, items in (('pending', pending), ('failed', failed)) for item in items]
+    with queue_db_lock:
+        db = get_queue_db()
+        with db:
+            db.execute("BEGIN")
+            db.executemany("INSERT INTO downloads (url, format_code, download_path, state, added_at, updated_at) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", rows)
     save_config(config)
+    print_colored(f"Moved {len(pending)} queued and {len(failed)} failed downloads to {QUEUE_DB_FILE}.", Colors.LIGHT_CYAN)
+
+# Function to add a new download to the queue. Returns False when it was already downloaded or queued.
+# postprocess lists the item's post-processing steps and defaults to the configured ones.
+def add_download_to_queue(url, format_code, download_path, config, postprocess=None):
+    if is_in_download_archive(url, format_code):
+        print_colored(f"Skipping {url}: already downloaded in this format.", Colors.LIGHT_YELLOW)
+        return False
+    steps = parse_postprocess_steps(config.get("postprocess") if postprocess is None else postprocess)
+    if insert_download(url, format_code, download_path, steps) is None:
+        print_colored(f"Skipping {url}: already in the queue.", Colors.LIGHT_YELLOW)
+        return False
+    return True
+
+# Function to insert a pending queue item. Returns the item as get_pending_downloads lists it,
+# or None when the same URL and format is already waiting or running.
+def insert_download(url, format_code, download_path, steps):
+    now = time.time()
+    with queue_db_lock:
+        db = get_queue_db()
+        if db.execute("SELECT 1 FROM downloads WHERE url = ? AND format_code = ? "
+                      "AND state IN ('pending', 'running', 'postprocessing')", (url, format_code)).fetchone():
+            return None
+        cursor = db.execute("INSERT INTO downloads (url, format_code, download_path, state, added_at, updated_at, postprocess) "
+                            "VALUES (?, ?, ?, 'pending', ?, ?, ?)", (url, format_code, download_path, now, now, ','.join(steps)))
+    return {"id": cursor.lastrowid, "url": url, "format_code": format_code, "download_path": download_path, "attempts": 0,
+            "partial_bytes": 0, "postprocess": ','.join(steps), "added_at": now}
+
+# Function to move a queue item to a new state (pending, running, postprocessing, done or failed)
+def set_download_state(item_id, state, error=None, attempts=None):
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET state = ?, error = ?, attempts = COALESCE(?, attempts), updated_at = ? "
+                               "WHERE id = ?", (state, error, attempts, time.time(), item_id))
+
+# Function to record the throughput of a finished queue item
+def record_download_stats(item_id, stats):
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET downloaded_bytes = ?, elapsed = ?, average_speed = ?, fragment_count = ? "
+                               "WHERE id = ?", (stats["downloaded_bytes"], stats["elapsed"], stats["average_speed"],
+                                                stats["fragment_count"], item_id))
+
+# Function to record how far a running queue item has got, so a retry or restart can report where it resumes
+def record_partial_progress(item_id, partial_bytes, partial_fragment):
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET partial_bytes = ?, partial_fragment = ? WHERE id = ?",
+                               (partial_bytes, partial_fragment, item_id))
+
+# Function to record the downloaded files a queue item hands to post-processing, so a restart can pick them up
+def record_postprocess_files(item_id, files):
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET postprocess_files = ? WHERE id = ?", (json.dumps(files), item_id))
+
+# Function to record how long a queue item's post-processing took
+def record_postprocess_elapsed(item_id, elapsed):
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET postprocess_elapsed = ? WHERE id = ?", (round(elapsed, 3), item_id))
+
+# Function to list items whose post-processing was interrupted. Items whose downloaded files are gone
+# go back to the queue to be downloaded again.
+def recover_interrupted_postprocessing():
+    stale = time.time() - QUEUE_OWNER_TIMEOUT
+    with queue_db_lock:
+        rows = [dict(row) for row in get_queue_db().execute(
+            "SELECT id, url, format_code, postprocess, postprocess_files FROM downloads "
+            "WHERE state = 'postprocessing' AND (heartbeat IS NULL OR heartbeat < ?) ORDER BY id", (stale,))]
+    items = []
+    for item in rows:
+        item["files"] = json.loads(item.pop("postprocess_files") or '[]')
+        with queue_db_lock:
+            # Claim the item, unless another run got to it first
+            claimed = get_queue_db().execute(
+                "UPDATE downloads SET owner = ?, heartbeat = ? WHERE id = ? AND state = 'postprocessing' "
+                "AND (heartbeat IS NULL OR heartbeat < ?)", (QUEUE_OWNER, time.time(), item["id"], stale)).rowcount
+        if not claimed:
+            continue
+        if item["files"] and all(os.path.exists(path) for path in item["files"]):
+            items.append(item)
+        else:
+            set_download_state(item["id"], 'pending')
+    return items
+
+# Function to put items that were running when the run that claimed them stopped back in the queue
+def recover_interrupted_downloads():
+    with queue_db_lock:
+        cursor = get_queue_db().execute("UPDATE downloads SET state = 'pending', owner = NULL, updated_at = ? "
+                                        "WHERE state = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                                        (time.time(), time.time() - QUEUE_OWNER_TIMEOUT))
+    return cursor.rowcount
+
+# Function to claim a pending item for this run. Returns False when another run has already taken it.
+def claim_download(item_id):
+    now = time.time()
+    with queue_db_lock:
+        cursor = get_queue_db().execute("UPDATE downloads SET state = 'running', owner = ?, heartbeat = ?, updated_at = ? "
+                                        "WHERE id = ? AND state = 'pending'", (QUEUE_OWNER, now, now, item_id))
+    return cursor.rowcount == 1
+
+# Function to refresh the heartbeat of the items this run is working on
+def touch_queue_heartbeat():
+    with queue_db_lock:
+        get_queue_db().execute("UPDATE downloads SET heartbeat = ? WHERE owner = ? AND state IN ('running', 'postprocessing')",
+                               (time.time(), QUEUE_OWNER))
+
+# Function to list the pending queue items in the order they were added
+def get_pending_downloads():
+    with queue_db_lock:
+        rows = get_queue_db().execute("SELECT id, url, format_code, download_path, attempts, partial_bytes, postprocess, "
+                                      "added_at FROM downloads WHERE state = 'pending' ORDER BY id").fetchall()
+    return [dict(row) for row in rows]
+
+# Function to get the host of a URL, used to cap concurrent downloads per site
+def get_url_host(url):
+    host = (urllib.parse.urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host == 'youtu.be':
+        host = 'youtube.com'
+    return host
+
+# Live aggregate progress line for parallel queue runs
+class QueueProgress:
+    def __init__(self, total):
+        self.total = total
+        self.running = 0
+        self.postprocessing_count = 0
+        self.completed = 0
+        self.failed = 0
+        self.downloaded_bytes = 0
+        # Latest progress event of every running download
+        self.active = {}
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.last_render = 0
 
-# Function to process the download queue
+    def render(self):
+        self.last_render = time.time()
+        elapsed = int(self.last_render - self.start_time)
+        speed = sum(event["speed"] or 0 for event in self.active.values())
+        downloaded = self.downloaded_bytes + sum(event["downloaded_bytes"] for event in self.active.values())
+        line = (f"Queue: {self.completed + self.failed}/{self.total} finished | {self.running} running | "
+                f"{self.postprocessing_count} post-processing | {self.failed} failed | {format_bytes(downloaded)} at {format_bytes(speed)}/s | {elapsed}s elapsed")
+        sys.stdout.write(f"\r\033[K{Colors.PASTEL_ORANGE}{line}{Colors.RESET}")
+        sys.stdout.flush()
+
+    def log(self, message, color):
+        with self.lock:
+            sys.stdout.write("\r\033[K")
+            print_colored(message, color)
+            self.render()
+
+    def added(self, count=1):
+        # Playlists grow the total as their entries stream in
+        with self.lock:
+            self.total += count
+            self.render()
+
+    def started(self, url):
+        with self.lock:
+            self.running += 1
+        self.log(f"Starting download for {url}...", Colors.LIGHT_GREEN)
+
+    def update(self, url, event):
+        with self.lock:
+            # Finished files are folded into the total so merged streams are not counted twice
+            if event["status"] == 'finished':
+                self.downloaded_bytes += event["total_bytes"] or event["downloaded_bytes"]
+                self.active.pop(url, None)
+            else:
+                self.active[url] = event
+            # Redraw at most a few times per second, whatever the number of workers
+            if time.time() - self.last_render >= 0.25:
+                self.render()
+
+    def postprocessing(self, url, resumed=False):
+        # The download is done (or was done in an earlier run) and its files wait for the post-processing pool
+        with self.lock:
+            if not resumed:
+                self.running -= 1
+            self.postprocessing_count += 1
+            self.active.pop(url, None)
+            self.render()
+
+    def finished(self, url, success, postprocessed=False):
+        # success is None when the item goes back to the queue for a retry
+        with self.lock:
+            if postprocessed:
+                self.postprocessing_count -= 1
+            else:
+                self.running -= 1
+            self.active.pop(url, None)
+            if success:
+                self.completed += 1
+            elif success is not None:
+                self.failed += 1
+            self.render()
+
+    def close(self):
+        with self.lock:
+            self.render()
+            print()
+
+# Queue runs append one JSON line per finished attempt and one per run to the metrics file, and keep a
+# Prometheus text file (for node_exporter's textfile collector) up to date. Both are written by a background
+# thread, so the download workers only hand over a record at the end of each attempt.
+METRICS_FILE = 'YTGet_Metrics.jsonl'
+PROMETHEUS_FILE = 'YTGet_Metrics.prom'
+METRICS_FLUSH_INTERVAL = 10
+# Stages of a queue item as (name, timing it starts at, timing it ends at)
+METRICS_STAGES = (
+    ('wait', 'queued', 'started'),
+    ('extract', 'started', 'extracted'),
+    ('transfer', 'extracted', 'downloaded'),
+    ('postprocess_wait', 'downloaded', 'postprocess_started'),
+    ('postprocess', 'postprocess_started', 'postprocessed'),
+)
+
+# Per-item timing spans and counters of one queue run
+class QueueMetrics:
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.outcomes = {}
+        self.retries = {}
+        self.downloaded_bytes = 0
+        # Seconds spent in each stage, as [sum, count]
+        self.stage_seconds = {}
+        self.records = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self.write_records, daemon=True)
+        self.writer.start()
+
+    def item_finished(self, item, outcome, stats=None, error_class=None):
+        # outcome is done, failed or retry. Timings are Unix timestamps set as the item moves through the stages.
+        timings = item.setdefault("timings", {})
+        timings["finished"] = time.time()
+        durations = {}
+        for stage, start, end in METRICS_STAGES:
+            if timings.get(start) and timings.get(end):
+                # Items queued before this run only count as waiting from the start of the run
+                started = max(timings[start], self.start_time) if start == 'queued' else timings[start]
+                durations[stage] = round(max(0.0, timings[end] - started), 3)
+        if timings.get("started"):
+            # Whatever the stages do not account for is YTGet's own time: dispatching, hand-offs and bookkeeping
+            measured = sum(seconds for stage, seconds in durations.items() if stage != 'wait')
+            durations["overhead"] = round(max(0.0, timings["finished"] - timings["started"] - measured), 3)
+        downloaded = (stats or {}).get("downloaded_bytes") or 0
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome == 'retry':
+                self.retries[error_class] = self.retries.get(error_class, 0) + 1
+            self.downloaded_bytes += downloaded
+            for stage, seconds in durations.items():
+                totals = self.stage_seconds.setdefault(stage, [0.0, 0])
+                totals[0] += seconds
+                totals[1] += 1
+        self.records.put({
+            "type": "item", "run_id": self.run_id, "id": item["id"], "url": item["url"], "outcome": outcome,
+            "attempt": item.get("attempts"), "error_class": error_class, "downloaded_bytes": downloaded,
+            "timings": {name: round(value, 3) for name, value in timings.items() if value}, "durations": durations,
+        })
+
+    def summary(self):
+        with self.lock:
+            return {
+                "type": "run", "run_id": self.run_id, "started": round(self.start_time, 3),
+                "duration": round(time.time() - self.start_time, 3), "outcomes": dict(self.outcomes),
+                "retries": dict(self.retries), "downloaded_bytes": self.downloaded_bytes,
+                "average_durations": {stage: round(total / count, 3) for stage, (total, count) in self.stage_seconds.items()},
+            }
+
+    def write_records(self):
+        running = True
+        while running:
+            batch = []
+            try:
+                # Wait for the first record, then take everything already queued behind it
+                record = self.records.get(timeout=METRICS_FLUSH_INTERVAL)
+                while record is not None:
+                    batch.append(record)
+                    record = self.records.get_nowait()
+                running = False
+            except queue.Empty:
+                pass
+            try:
+                if batch and self.jsonl_path:
+                    with open(self.jsonl_path, 'a', encoding='utf-8') as metrics_file:
+                        metrics_file.writelines(json.dumps(record) + '\n' for record in batch)
+                if self.prometheus_path:
+                    self.write_prometheus()
+            except OSError as e:
+                print_colored(f"\r\033[KError writing metrics: {e}", Colors.LIGHT_RED)
+
+    def write_prometheus(self):
+        summary = self.summary()
+        lines = [
+            "# HELP ytget_queue_items_total Finished queue item attempts by outcome.",
+            "# TYPE ytget_queue_items_total counter",
+        ]
+        lines += [f'ytget_queue_items_total{{outcome="{outcome}"}} {count}' for outcome, count in sorted(summary["outcomes"].items())]
+        lines += ["# HELP ytget_queue_retries_total Retried attempts by error class.", "# TYPE ytget_queue_retries_total counter"]
+        lines += [f'ytget_queue_retries_total{{error_class="{error_class}"}} {count}'
+                  for error_class, count in sorted(summary["retries"].items())]
+        lines += ["# HELP ytget_queue_downloaded_bytes_total Bytes downloaded by the queue.",
+                  "# TYPE ytget_queue_downloaded_bytes_total counter",
+                  f"ytget_queue_downloaded_bytes_total {summary['downloaded_bytes']}",
+                  "# HELP ytget_queue_stage_seconds Time queue items spent in each stage.",
+                  "# TYPE ytget_queue_stage_seconds summary"]
+        with self.lock:
+            stage_seconds = sorted(self.stage_seconds.items())
+        for stage, (total, count) in stage_seconds:
+            lines += [f'ytget_queue_stage_seconds_sum{{stage="{stage}"}} {total:.3f}',
+                      f'ytget_queue_stage_seconds_count{{stage="{stage}"}} {count}']
+        lines += ["# HELP ytget_queue_run_start_time_seconds Start of the current or last queue run.",
+                  "# TYPE ytget_queue_run_start_time_seconds gauge",
+                  f"ytget_queue_run_start_time_seconds {summary['started']}",
+                  "# HELP ytget_queue_run_duration_seconds Duration of the current or last queue run.",
+                  "# TYPE ytget_queue_run_duration_seconds gauge",
+                  f"ytget_queue_run_duration_seconds {summary['duration']}"]
+        # Swap the file in whole, so a collector never reads half of it
+        with open(self.prometheus_path + '.tmp', 'w', encoding='utf-8') as prometheus_file:
+            prometheus_file.write('\n'.join(lines) + '\n')
+        os.replace(self.prometheus_path + '.tmp', self.prometheus_path)
+
+    def close(self):
+        # Writes the run summary and the final Prometheus file, and returns the summary
+        summary = self.summary()
+        self.records.put(summary)
+        self.records.put(None)
+        self.writer.join()
+        return summary
+
+# Function to print the summary of a queue run
+def print_run_summary(summary):
+    outcomes = summary["outcomes"]
+    averages = summary["average_durations"]
+    print_colored(f"Run summary: {outcomes.get('done', 0)} done, {outcomes.get('failed', 0)} failed, "
+                  f"{outcomes.get('retry', 0)} retried, {format_bytes(summary['downloaded_bytes'])} in "
+                  f"{summary['duration']:.0f}s.", Colors.LIGHT_CYAN)
+    if averages:
+        print_colored("Average seconds per item: " + ", ".join(f"{stage.replace('_', ' ')} {seconds:.2f}"
+                                                               for stage, seconds in averages.items()), Colors.GRAY)
+
+# Downloads never get less than this, so a small budget split many ways still makes progress
+MIN_RATE_LIMIT = 16 * 1024
+
+# Function to parse a rate such as 2000000, "500K" or "2M" into bytes per second (None means unlimited)
+def parse_rate(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().upper().replace('/S', '').rstrip('B')
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    try:
+        if text and text[-1] in multipliers:
+            rate = int(float(text[:-1]) * multipliers[text[-1]])
+        else:
+            rate = int(float(text))
+    except ValueError:
+        raise ValueError(f"Invalid rate {value!r}, expected bytes per second such as 500K or 2M") from None
+    if rate < 0:
+        raise ValueError(f"Invalid rate {value!r}, it cannot be negative")
+    return rate
+
+# Function to parse an "H:MM" or "HH:MM" time of day into minutes after midnight
+def parse_time_of_day(value):
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', str(value).strip())
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid time of day {value!r}, expected HH:MM")
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+# Function to check whether a time of day falls inside an "HH:MM"-"HH:MM" window, which may wrap past midnight
+def is_in_time_window(start, end, moment):
+    minutes = moment.tm_hour * 60 + moment.tm_min
+    start_minutes = parse_time_of_day(start)
+    end_minutes = parse_time_of_day(end)
+    if start_minutes <= end_minutes:
+        return start_minutes <= minutes < end_minutes
+    return minutes >= start_minutes or minutes < end_minutes
+
+# Function to get the queue's total bandwidth budget right now, in bytes per second.
+# None means unlimited and 0 means no new downloads should start.
+def get_bandwidth_limit(config, now=None):
+    moment = time.localtime(now)
+    for window in config.get("bandwidth_windows") or []:
+        if is_in_time_window(window["start"], window["end"], moment):
+            return parse_rate(window.get("limit"))
+    return parse_rate(config.get("bandwidth_limit"))
+
+# Function to check bandwidth_limit and bandwidth_windows, raising ValueError on the first setting that is wrong
+def check_bandwidth_settings(config):
+    parse_rate(config.get("bandwidth_limit"))
+    for window in config.get("bandwidth_windows") or []:
+        if not isinstance(window, dict) or "start" not in window or "end" not in window:
+            raise ValueError(f"Invalid bandwidth window {window!r}, expected start, end and limit")
+        parse_time_of_day(window["start"])
+        parse_time_of_day(window["end"])
+        parse_rate(window.get("limit"))
+
+# Function to process the download queue. Returns the number of items that failed.
 def process_queue(config):
-    if not config["queue"]:
+    # The settings are checked before anything is claimed, since the dispatcher reads them for every item
+    try:
+        check_bandwidth_settings(config)
+    except ValueError as e:
+        print_colored(f"Invalid bandwidth settings in YTGet_Conf.json: {e}", Colors.LIGHT_RED)
+        return len(get_pending_downloads())
+    recovered = recover_interrupted_downloads()
+    if recovered:
+        print_colored(f"Resuming {recovered} download(s) interrupted in a previous run.", Colors.LIGHT_CYAN)
+    interrupted_postprocessing = recover_interrupted_postprocessing()
+    heartbeat_stop = threading.Event()
+
+    def heartbeat():
+        while not heartbeat_stop.wait(QUEUE_HEARTBEAT_INTERVAL):
+            touch_queue_heartbeat()
+    queue_copy = get_pending_downloads()
+    if not queue_copy and not interrupted_postprocessing:
         print_colored("Queue is empty.", Colors.LIGHT_YELLOW)
-        return
-    
-    queue_copy = config["queue"][:]
+        return 0
+
+    max_workers = max(1, int(config.get("max_workers", 3)))
+    max_per_host = max(1, int(config.get("max_per_host", 2)))
+    max_retries = max(1, int(config.get("max_retries", 10)))
+
+    # Group pending items per host so a slow site never blocks the others
+    pending_by_host = {}
     for item in queue_copy:
+        pending_by_host.setdefault(get_url_host(item["url"]), deque()).append(item)
+
+    progress = QueueProgress(len(queue_copy) + len(interrupted_postprocessing))
+    metrics = QueueMetrics(config.get("metrics_file"), config.get("prometheus_file"))
+    threading.Thread(target=heartbeat, daemon=True).start()
+    # ffmpeg and checksums run in their own pool, so a finished download frees its slot right away
+    postprocess_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(config.get("postprocess_workers", 2))))
+    running_by_host = {}
+    # Items waiting out a retry delay, as (ready time, id, item), and hosts backing off after a rate limit
+    delayed = []
+    host_ready_at = {}
+    host_rate_limits = {}
+    # Rate limit handed to each running item, so new downloads get what the others leave of the budget
+    rate_by_item = {}
+    paused = False
+    slots = threading.Condition()
+
+    def postprocess_worker(item, files, stats=None):
         url = item["url"]
-        format_code = item["format_code"]
-        download_path = item["download_path"] or config["download_path"] or os.getcwd()
-        print(f"{Colors.LIGHT_GREEN}Starting download for {url}...{Colors.RESET}")
-        if download_video(url, format_code, download_path):
-            print(f"{Colors.LIGHT_GREEN}Download completed for {url}.{Colors.RESET}")
-            config["queue"].remove(item)
+        timings = item.setdefault("timings", {})
+        timings["postprocess_started"] = time.time()
+        success, error = postprocess_download(url, files, parse_postprocess_steps(item["postprocess"]))
+        timings["postprocessed"] = time.time()
+        record_postprocess_elapsed(item["id"], timings["postprocessed"] - timings["postprocess_started"])
+        if success:
+            record_in_download_archive(url, item["format_code"], write=True)
+            set_download_state(item["id"], 'done')
+            metrics.item_finished(item, 'done', stats)
+            progress.finished(url, True, postprocessed=True)
+            progress.log(f"Download completed for {url}.", Colors.LIGHT_GREEN)
         else:
-            print(f"{Colors.LIGHT_RED}Download failed for {url}. Adding to failed downloads.{Colors.RESET}")
-            config["failed_downloads"].append(item)
-            config["queue"].remove(item)
-        save_config(config)
+            set_download_state(item["id"], 'failed', f"postprocess: {error}")
+            metrics.item_finished(item, 'failed', stats, 'postprocess')
+            progress.finished(url, False, postprocessed=True)
+            progress.log(f"Post-processing failed for {url}: {error}. Adding to failed downloads.", Colors.LIGHT_RED)
+
+    def queue_playlist_entries(item, download_path):
+        # Entries become queue items of their own as yt-dlp lists them, so they run under the same worker,
+        # per-host and bandwidth limits as everything else, and survive a restart
+        count = 0
+        for video_data in stream_playlist_entries(item["url"]):
+            video_url = get_playlist_entry_url(video_data)
+            if is_in_download_archive(video_url, item["format_code"], video_data):
+                continue
+            # Entries inherit the playlist's post-processing steps and go through the post-processing pool one by one
+            entry = insert_download(video_url, item["format_code"], download_path, parse_postprocess_steps(item["postprocess"]))
+            if entry is None:
+                continue
+            progress.added()
+            with slots:
+                pending_by_host.setdefault(get_url_host(video_url), deque()).append(entry)
+                slots.notify_all()
+            count += 1
+        return count
+
+    def worker(item, host, rate_limit):
+        url = item["url"]
+        download_path = item["download_path"] or config["download_path"] or os.getcwd()
+        success, error_class, error = False, 'transient', None
+        stats = DownloadStats()
+        # Files of the download, handed to the post-processing pool when the item has steps or split streams
+        files = []
+        # Without ffmpeg the streams are left to yt-dlp's own merge, which reports the missing ffmpeg before downloading
+        ffmpeg_available = is_ffmpeg_available()
+        split_formats = split_format_code(item["format_code"]) if ffmpeg_available else None
+        deferred = bool(split_formats or item["postprocess"])
+        try:
+            if is_in_download_archive(url, item["format_code"]):
+                progress.log(f"Skipping {url}: already downloaded in this format.", Colors.GRAY)
+                success = True
+            elif not ffmpeg_available and set(parse_postprocess_steps(item["postprocess"])) - {'merge', 'checksum'}:
+                error_class, error = 'permanent', f"{ffmpeg_path} was not found, so the download cannot be post-processed"
+            elif is_playlist_url(url):
+                count = queue_playlist_entries(item, download_path)
+                progress.log(f"Queued {count} video(s) from {url}.", Colors.GRAY)
+                success = True
+            else:
+                last_saved = time.time()
+
+                def on_progress(event):
+                    nonlocal last_saved
+                    if "extracted" not in item["timings"]:
+                        # The first progress event marks the end of extraction and the start of the transfer
+                        item["timings"]["extracted"] = time.time()
+                    stats(event)
+                    progress.update(url, event)
+                    if event["status"] == 'finished' and event["filename"] not in files:
+                        files.append(event["filename"])
+                    if time.time() - last_saved >= PARTIAL_SAVE_INTERVAL:
+                        last_saved = time.time()
+                        item["partial_bytes"] = stats.downloaded_bytes()
+                        record_partial_progress(item["id"], item["partial_bytes"], event["fragment_index"])
+                os.makedirs(download_path, exist_ok=True)
+                # Split streams are downloaded as separate files in one yt-dlp run and merged by the post-processing pool
+                success, error_class, error = attempt_download(
+                    url, ','.join(split_formats) if split_formats else item["format_code"], download_path, quiet=True,
+                    on_progress=on_progress, use_info_json=item["attempts"] == 0, rate_limit=rate_limit,
+                    output_template=SPLIT_OUTPUT_TEMPLATE if split_formats else '%(title)s.%(ext)s', archive=not deferred)
+                if success and deferred and not files:
+                    # yt-dlp reported no files (nothing was downloaded), so there is nothing to post-process
+                    record_in_download_archive(url, item["format_code"], write=True)
+        except Exception as e:
+            error = str(e)
+            error_class = classify_download_error(None, error)
+        finally:
+            item["attempts"] += 1
+            item["timings"]["downloaded"] = time.time()
+            summary = stats.summary()
+            record_download_stats(item["id"], summary)
+            retry = not success and error_class != 'permanent' and item["attempts"] < max_retries
+            if success and deferred and files:
+                set_download_state(item["id"], 'postprocessing', attempts=item["attempts"])
+                record_postprocess_files(item["id"], files)
+                progress.postprocessing(url)
+                postprocess_pool.submit(postprocess_worker, item, files, summary)
+            elif success:
+                set_download_state(item["id"], 'done', attempts=item["attempts"])
+                metrics.item_finished(item, 'done', summary)
+                progress.finished(url, True)
+                progress.log(f"Download completed for {url}.", Colors.LIGHT_GREEN)
+            elif retry:
+                delay = get_retry_delay(error_class, item["attempts"])
+                set_download_state(item["id"], 'pending', f"{error_class}: {error}", item["attempts"])
+                metrics.item_finished(item, 'retry', summary, error_class)
+                # The next attempt is timed from the moment it is queued again
+                item["timings"] = {"queued": time.time()}
+                progress.finished(url, None)
+                progress.log(f"Download failed for {url} ({error_class}). Retrying in {delay:.0f}s.", Colors.LIGHT_YELLOW)
+            else:
+                set_download_state(item["id"], 'failed', f"{error_class}: {error}", item["attempts"])
+                metrics.item_finished(item, 'failed', summary, error_class)
+                progress.finished(url, False)
+                progress.log(f"Download failed for {url}: {error}. Adding to failed downloads.", Colors.LIGHT_RED)
+            with slots:
+                running_by_host[host] -= 1
+                rate_by_item.pop(item["id"], None)
+                if success:
+                    host_rate_limits.pop(host, None)
+                elif retry:
+                    # A rate limit holds back the whole host, other failures only this item
+                    if error_class == 'rate_limited':
+                        host_rate_limits[host] = host_rate_limits.get(host, 0) + 1
+                        host_ready_at[host] = time.time() + get_retry_delay(error_class, host_rate_limits[host])
+                    heapq.heappush(delayed, (time.time() + delay, item["id"], item))
+                slots.notify_all()
+
+    for item in interrupted_postprocessing:
+        progress.log(f"Resuming post-processing of {item['url']}.", Colors.GRAY)
+        progress.postprocessing(item["url"], resumed=True)
+        postprocess_pool.submit(postprocess_worker, item, item["files"])
+
+    with slots:
+        while pending_by_host or delayed or any(running_by_host.values()):
+            now = time.time()
+            # Move items whose retry delay has passed back to the end of their host's queue
+            while delayed and delayed[0][0] <= now:
+                item = heapq.heappop(delayed)[2]
+                pending_by_host.setdefault(get_url_host(item["url"]), deque()).append(item)
+            bandwidth = get_bandwidth_limit(config, now)
+            if bandwidth == 0 and pending_by_host:
+                # The current time window allows no downloads: let running ones finish and check again shortly
+                if not paused:
+                    progress.log("Bandwidth window is closed. Waiting for the next window...", Colors.LIGHT_YELLOW)
+                    paused = True
+                slots.wait(30)
+                continue
+            paused = False
+            # Pick the first host that has pending items, a free per-host slot and no active backoff
+            host = None
+            if sum(running_by_host.values()) < max_workers:
+                host = next((h for h in pending_by_host
+                             if running_by_host.get(h, 0) < max_per_host and host_ready_at.get(h, 0) <= now), None)
+            if host is None:
+                wake_times = [delayed[0][0]] if delayed else []
+                wake_times += [host_ready_at[h] for h in pending_by_host if host_ready_at.get(h, 0) > now]
+                slots.wait(max(0.05, min(wake_times) - now) if wake_times else None)
+                continue
+            # Split what is left of the budget evenly over the slots that will be busy once this item starts
+            rate_limit = None
+            if bandwidth:
+                running = sum(running_by_host.values())
+                # Only max_per_host items of each site can run at once, however many are pending
+                planned = min(max_workers, sum(min(max_per_host, running_by_host.get(h, 0) + len(pending_by_host.get(h, ())))
+                                               for h in set(running_by_host) | set(pending_by_host)))
+                rate_limit = max(MIN_RATE_LIMIT, (bandwidth - sum(rate_by_item.values())) / max(1, planned - running))
+            item = pending_by_host[host].popleft()
+            if not pending_by_host[host]:
+                del pending_by_host[host]
+            if not claim_download(item["id"]):
+                progress.log(f"Skipping {item['url']}: another queue run is working on it.", Colors.GRAY)
+                progress.added(-1)
+                continue
+            running_by_host[host] = running_by_host.get(host, 0) + 1
+            if rate_limit:
+                rate_by_item[item["id"]] = rate_limit
+            item.setdefault("timings", {"queued": item["added_at"]})["started"] = time.time()
+            progress.started(item["url"])
+            if item["partial_bytes"]:
+                progress.log(f"Resuming {item['url']} from {format_bytes(item['partial_bytes'])}.", Colors.GRAY)
+            threading.Thread(target=worker, args=(item, host, rate_limit), daemon=True).start()
+    postprocess_pool.shutdown(wait=True)
+    heartbeat_stop.set()
+    progress.close()
+    print_run_summary(metrics.close())
+    return progress.failed
+
+# Function to check whether a URL points to a playlist or channel rather than a single video
+def is_playlist_url(url):
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed.query)
+    if 'list' in query and 'v' not in query:
+        return True
+    if get_url_host(url) == 'youtube.com':
+        return parsed.path.startswith(('/playlist', '/@', '/channel/', '/c/', '/user/'))
+    return False
+
+# Function to build a downloadable URL from a flat playlist entry
+def get_playlist_entry_url(video_data):
+    url = video_data.get('url') or ''
+    if url.startswith(('http://', 'https://')):
+        return url
+    return f"https://www.youtube.com/watch?v={video_data['id']}"
+
+# Function to stream playlist entries as yt-dlp emits them, instead of waiting for the whole listing
+def stream_playlist_entries(playlist_url):
+    if use_library_backend():
+        yield from stream_library_playlist_entries(playlist_url)
+        return
+    process = subprocess.Popen(get_yt_dlp_command() + ['--flat-playlist', '-j', playlist_url],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    # stderr is drained on its own thread so a chatty yt-dlp cannot block on a full pipe while stdout is read
+    errors = []
+
+    def read_errors():
+        for line in process.stderr:
+            if line.startswith('ERROR:'):
+                errors.append(line.rstrip())
+    error_reader = threading.Thread(target=read_errors, daemon=True)
+    error_reader.start()
+    finished = False
+    try:
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                video_data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if video_data.get('id'):
+                yield video_data
+        finished = True
+    finally:
+        # Stop yt-dlp if the caller gave up on the listing early
+        if process.poll() is None and not finished:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        error_reader.join()
+        process.stderr.close()
+    # A failed listing must not look like an empty playlist
+    if returncode != 0:
+        raise RuntimeError(errors[-1] if errors else f"yt-dlp exited with code {returncode}")
+
+# Function to stream flat playlist entries in-process. YouTube playlists yield entries page by page.
+def stream_library_playlist_entries(playlist_url):
+    key, pooled = checkout_youtube_dl({'extract_flat': 'in_playlist'})
+    try:
+        info = pooled.ydl.extract_info(playlist_url, download=False, process=False)
+        for video_data in info.get('entries') or []:
+            if video_data and video_data.get('id'):
+                yield video_data
+    finally:
+        checkin_youtube_dl(key, pooled)
 
 # Function to fetch playlist videos
 def fetch_playlist_videos(playlist_url):
     try:
-        result = subprocess.run(['yt-dlp.exe', '--flat-playlist', '-j', playlist_url], capture_output=True, text=True)
-        video_urls = []
-        for line in result.stdout.splitlines():
-            video_data = json.loads(line)
-            video_urls.append(f"https://www.youtube.com/watch?v={video_data['id']}")
-        return video_urls
+        return [get_playlist_entry_url(video_data) for video_data in stream_playlist_entries(playlist_url)]
     except Exception as e:
         print_colored(f"Error fetching playlist videos: {e}", Colors.LIGHT_RED)
         return []
 
+# Function to download every video of a playlist through a bounded pool of workers.
+# Entries are handed to the workers as soon as yt-dlp lists them. Returns the URLs that failed.
+def download_playlist(playlist_url, format_code, download_path, max_workers=3, progress=None, on_progress=None,
+                      rate_limit=None, max_retries=10):
+    os.makedirs(download_path, exist_ok=True)
+    max_workers = max(1, int(max_workers))
+    # Entries waiting for a worker, failed entries waiting for their retry time and entries not yet done for good.
+    # Failed entries go back to `delayed` instead of sleeping, so the wait does not hold a worker.
+    jobs = threading.Condition()
+    waiting = deque()
+    delayed = []
+    outstanding = 0
+    listing_done = False
+    owns_progress = progress is None
+    if owns_progress:
+        progress = QueueProgress(0)
+    failed_urls = []
+
+    def next_job():
+        with jobs:
+            while True:
+                now = time.time()
+                if delayed and delayed[0][0] <= now:
+                    return heapq.heappop(delayed)[2]
+                if waiting:
+                    # Wake the listing, which waits while the hand-off is full
+                    jobs.notify_all()
+                    return waiting.popleft()
+                if listing_done and not outstanding:
+                    return None
+                jobs.wait(delayed[0][0] - now if delayed else None)
+
+    def worker():
+        nonlocal outstanding
+        while True:
+            job = next_job()
+            if job is None:
+                return
+            index, video_url, video_data, attempt = job
+            progress.started(video_url)
+
+            def report_progress(event):
+                if on_progress:
+                    on_progress(event)
+                progress.update(video_url, event)
+            # A stale info JSON fails fast, so later attempts go back to the URL
+            success, error_class, error = attempt_download(
+                video_url, format_code, download_path, quiet=True, on_progress=report_progress,
+                use_info_json=attempt == 0, rate_limit=rate_limit / max_workers if rate_limit else None)
+            if success:
+                record_in_download_archive(video_url, format_code, video_data)
+            elif error_class != 'permanent' and attempt + 1 < max_retries:
+                delay = get_retry_delay(error_class, attempt + 1)
+                progress.finished(video_url, None)
+                progress.log(f"Download failed for {video_url} ({error_class}). Retrying in {delay:.0f}s.",
+                             Colors.LIGHT_YELLOW)
+                with jobs:
+                    heapq.heappush(delayed, (time.time() + delay, index, (index, video_url, video_data, attempt + 1)))
+                    jobs.notify_all()
+                continue
+            else:
+                progress.log(f"Download failed for {video_url}: {error}.", Colors.LIGHT_RED)
+                failed_urls.append(video_url)
+            progress.finished(video_url, success)
+            with jobs:
+                outstanding -= 1
+                jobs.notify_all()
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in workers:
+        thread.start()
+    try:
+        for index, video_data in enumerate(stream_playlist_entries(playlist_url)):
+            video_url = get_playlist_entry_url(video_data)
+            if is_in_download_archive(video_url, format_code, video_data):
+                progress.log(f"Skipping {video_url}: already downloaded in this format.", Colors.GRAY)
+                continue
+            progress.added()
+            with jobs:
+                # Keep the hand-off small so the listing never runs far ahead of the downloads
+                while len(waiting) >= max_workers * 2:
+                    jobs.wait()
+                waiting.append((index, video_url, video_data, 0))
+                outstanding += 1
+                jobs.notify_all()
+    except Exception as e:
+        progress.log(f"Error fetching playlist videos: {e}", Colors.LIGHT_RED)
+        failed_urls.append(playlist_url)
+    finally:
+        with jobs:
+            listing_done = True
+            jobs.notify_all()
+        for thread in workers:
+            thread.join()
+        if owns_progress:
+            progress.close()
+    return failed_urls
+
 # Function to download the best quality (audio+video) for each video in a playlist
-def download_playlist_best_quality(playlist_url, download_path):
-    video_urls = fetch_playlist_videos(playlist_url)
-    for video_url in video_urls:
-        format_code = 'bestvideo+bestaudio/best'
-        if not download_video(video_url, format_code, download_path):
-            print_colored(f"Failed to download best quality for {video_url}.", Colors.LIGHT_RED)
+def download_playlist_best_quality(playlist_url, download_path, max_workers=3):
+    for video_url in download_playlist(playlist_url, 'bestvideo+bestaudio/best', download_path, max_workers):
+        print_colored(f"Failed to download best quality for {video_url}.", Colors.LIGHT_RED)
 
 # Function to download the best audio for each video in a playlist
-def download_playlist_best_audio(playlist_url, download_path):
-    video_urls = fetch_playlist_videos(playlist_url)
-    for video_url in video_urls:
-        format_code = 'bestaudio/best'
-        if not download_video(video_url, format_code, download_path):
-            print_colored(f"Failed to download audio for {video_url}.", Colors.LIGHT_RED)
+def download_playlist_best_audio(playlist_url, download_path, max_workers=3):
+    for video_url in download_playlist(playlist_url, 'bestaudio/best', download_path, max_workers):
+        print_colored(f"Failed to download audio for {video_url}.", Colors.LIGHT_RED)
+
 # Function to Update yt-dlp & YTGet
-def handle_update_youtube():
-    latest_version_youtube = get_latest_version_youtube()
+def handle_update_youtube(report=print_colored):
+    latest_version_youtube = get_latest_version_youtube(report)
     local_version_youtube = get_local_version_youtube()
 
     # Skip update if rate limit exceeded
     if latest_version_youtube is None and "403" in str(latest_version_youtube):
-        print_colored("Rate limit exceeded. Skipping YTGet update check.", Colors.LIGHT_RED)
+        report("Rate limit exceeded. Skipping YTGet update check.", Colors.LIGHT_RED)
         return  # Skip the rest of the update logic
 
     if local_version_youtube is None:
         if latest_version_youtube:
-            print_colored(f"YTGet.py not found. Downloading the latest version...", Colors.LIGHT_RED)
-            download_latest_version_youtube(latest_version_youtube)
-            print_colored(f"YTGet.py has been downloaded and updated to version {latest_version_youtube}.", Colors.LIGHT_GREEN)
+            report(f"YTGet.py not found. Downloading the latest version...", Colors.LIGHT_RED)
+            if download_latest_version_youtube(latest_version_youtube, report):
+                report(f"YTGet.py has been downloaded and updated to version {latest_version_youtube}.", Colors.LIGHT_GREEN)
         else:
-            print_colored("Cannot fetch latest version. Update aborted.", Colors.LIGHT_RED)
+            report("Cannot fetch latest version. Update aborted.", Colors.LIGHT_RED)
     elif latest_version_youtube != local_version_youtube:
-        print_colored(f"A new version of YTGet is available: {latest_version_youtube} (current version: {local_version_youtube})", Colors.LIGHT_RED)
-        print_colored("Skipping update due to rate limit.", Colors.LIGHT_RED)
+        report(f"A new version of YTGet is available: {latest_version_youtube} (current version: {local_version_youtube})", Colors.LIGHT_RED)
+        report("Skipping update due to rate limit.", Colors.LIGHT_RED)
     else:
-        print_colored(f"You already have the latest version: {latest_version_youtube}", Colors.LIGHT_GREEN)
+        report(f"You already have the latest version: {latest_version_youtube}", Colors.LIGHT_GREEN)
 
-def handle_update_yt_dlp():
-    latest_version_yt_dlp = get_latest_version_yt_dlp()
-    local_version_yt_dlp = get_local_version_yt_dlp()
+def handle_update_yt_dlp(report=print_colored):
+    latest_version_yt_dlp = get_latest_version_yt_dlp(report)
+    try:
+        local_version_yt_dlp = get_local_version_yt_dlp()
+    except subprocess.TimeoutExpired:
+        report("yt-dlp did not report its version in time. Skipping yt-dlp update check.", Colors.LIGHT_RED)
+        return
 
     # Skip update if rate limit exceeded
     if latest_version_yt_dlp is None and "403" in str(latest_version_yt_dlp):
-        print_colored("Rate limit exceeded. Skipping yt-dlp update check.", Colors.LIGHT_RED)
+        report("Rate limit exceeded. Skipping yt-dlp update check.", Colors.LIGHT_RED)
         return  # Skip the rest of the update logic
 
     if local_version_yt_dlp is None:
         if latest_version_yt_dlp:
-            print_colored(f"yt-dlp not found. Downloading the latest version...", Colors.LIGHT_RED)
-            download_latest_version_yt_dlp(latest_version_yt_dlp)
-            print_colored(f"yt-dlp has been downloaded and updated to version {latest_version_yt_dlp}.", Colors.LIGHT_GREEN)
+            report(f"yt-dlp not found. Downloading the latest version...", Colors.LIGHT_RED)
+            if download_latest_version_yt_dlp(latest_version_yt_dlp, report):
+                report(f"yt-dlp has been downloaded and updated to version {latest_version_yt_dlp}.", Colors.LIGHT_GREEN)
         else:
-            print_colored("Cannot fetch yt-dlp latest version. Update aborted.", Colors.LIGHT_RED)
+            report("Cannot fetch yt-dlp latest version. Update aborted.", Colors.LIGHT_RED)
     elif latest_version_yt_dlp != local_version_yt_dlp:
-        print_colored(f"A new version of yt-dlp is available: {latest_version_yt_dlp} (current version: {local_version_yt_dlp})", Colors.LIGHT_RED)
-        print_colored("Skipping update due to rate limit.", Colors.LIGHT_RED)
+        report(f"A new version of yt-dlp is available: {latest_version_yt_dlp} (current version: {local_version_yt_dlp})", Colors.LIGHT_RED)
+        report("Skipping update due to rate limit.", Colors.LIGHT_RED)
     else:
-        print_colored(f"You already have the latest version of yt-dlp: {latest_version_yt_dlp}", Colors.LIGHT_GREEN)
+        report(f"You already have the latest version of yt-dlp: {latest_version_yt_dlp}", Colors.LIGHT_GREEN)
+
+# Messages of the startup checks, which run in the background and are shown the next time the menu is drawn
+startup_notices = queue.SimpleQueue()
+
+# Function to keep a startup check message for the menu
+def report_startup_notice(message, color):
+    startup_notices.put((message, color))
+
+# Function to run the connectivity probe and, once a day, the update checks without holding up the menu
+def run_startup_checks(config):
+    if not check_internet_connectivity(report_startup_notice):
+        report_startup_notice("No internet connection detected. Downloads will fail until the connection is back.", Colors.LIGHT_RED)
+        return
+    # Skip update check if the last check was within 24 hours (86400 seconds)
+    current_time = time.time()
+    if current_time - config.get("last_update_check", 0) >= 86400:
+        handle_update_youtube(report_startup_notice)
+        handle_update_yt_dlp(report_startup_notice)
+        # Update the last check timestamp
+        with config_lock:
+            config["last_update_check"] = current_time
+            save_config(config)
+
+# Function to print the messages the startup checks have left so far
+def print_startup_notices():
+    while True:
+        try:
+            message, color = startup_notices.get_nowait()
+        except queue.Empty:
+            return
+        print_colored(message, color)
 
 def print_menu():
     print(f"{Colors.LIGHT_PINK}========== YTGet Main Menu =========={Colors.RESET}")
@@ -297,25 +2135,13 @@ def print_menu():
     print(f"{Colors.WHITE}9. Exit{Colors.RESET}")
 
 def main():
-    while not check_internet_connectivity():
-        print_colored("No internet connection detected. Please check your connection and press Enter to retry.", Colors.LIGHT_RED)
-        input()
-
     config = load_config()
 
-    # Skip update check if the last check was within 24 hours (86400 seconds)
-    current_time = time.time()
-    if current_time - config.get("last_update_check", 0) >= 86400:
-        print_colored("Checking for updates...", Colors.LIGHT_CYAN)
-        handle_update_youtube()
-        handle_update_yt_dlp()
-        # Update the last check timestamp
-        config["last_update_check"] = current_time
-        save_config(config)
-    else:
-        print_colored("Update check skipped: last check performed within the past 24 hours.", Colors.LIGHT_CYAN)
+    # The connectivity probe and update checks run in the background, so the menu shows up right away
+    threading.Thread(target=run_startup_checks, args=(config,), daemon=True).start()
 
     while True:
+        print_startup_notices()
         print_menu()
         choice = input(f"{Colors.LIGHT_CYAN}Enter your choice: {Colors.RESET}")
 
@@ -323,7 +2149,17 @@ def main():
             url = input(f"{Colors.LIGHT_CYAN}Enter the video URL: {Colors.RESET}")
             formats = get_available_formats(url)
             print(formats)
-            format_code = input(f"{Colors.LIGHT_CYAN}Enter the format code to download: {Colors.RESET}")
+            format_code = input(f"{Colors.LIGHT_CYAN}Enter the format code to download, or a rule such as '<=1080p, prefer=av01, smallest': {Colors.RESET}")
+            if is_format_rule(format_code):
+                try:
+                    format_code = select_format(get_format_records(url), format_code)
+                except Exception as e:
+                    print_colored(f"Error fetching available formats: {e}", Colors.LIGHT_RED)
+                    continue
+                if not format_code:
+                    print_colored("No format matches that rule.", Colors.LIGHT_RED)
+                    continue
+                print_colored(f"Selected format {format_code}.", Colors.LIGHT_GREEN)
             download_path = input(f"{Colors.LIGHT_CYAN}Enter the download path (leave empty for current directory): {Colors.RESET}")
             if not download_path:
                 download_path = os.getcwd()
@@ -331,8 +2167,8 @@ def main():
             if action == 'i':
                 download_video(url, format_code, download_path)
             else:
-                add_download_to_queue(url, format_code, download_path, config)
-                print_colored("Added to download queue.", Colors.LIGHT_GREEN)
+                if add_download_to_queue(url, format_code, download_path, config):
+                    print_colored("Added to download queue.", Colors.LIGHT_GREEN)
         elif choice == '2':
             url = input(f"{Colors.LIGHT_CYAN}Enter the video URL: {Colors.RESET}")
             download_path = input(f"{Colors.LIGHT_CYAN}Enter the download path (leave empty for current directory): {Colors.RESET}")
@@ -342,8 +2178,8 @@ def main():
             if action == 'i':
                 download_video(url, 'bestaudio/best', download_path)
             else:
-                add_download_to_queue(url, 'bestaudio/best', download_path, config)
-                print_colored("Added to download queue.", Colors.LIGHT_GREEN)
+                if add_download_to_queue(url, 'bestaudio/best', download_path, config):
+                    print_colored("Added to download queue.", Colors.LIGHT_GREEN)
         elif choice == '3':
             url = input(f"{Colors.LIGHT_CYAN}Enter the video URL: {Colors.RESET}")
             download_path = input(f"{Colors.LIGHT_CYAN}Enter the download path (leave empty for current directory): {Colors.RESET}")
@@ -353,8 +2189,8 @@ def main():
             if action == 'i':
                 download_video(url, 'bestvideo+bestaudio/best', download_path)
             else:
-                add_download_to_queue(url, 'bestvideo+bestaudio/best', download_path, config)
-                print_colored("Added to download queue.", Colors.LIGHT_GREEN)
+                if add_download_to_queue(url, 'bestvideo+bestaudio/best', download_path, config):
+                    print_colored("Added to download queue.", Colors.LIGHT_GREEN)
         elif choice == '4':
             playlist_url = input(f"{Colors.LIGHT_CYAN}Enter the playlist URL: {Colors.RESET}")
             download_path = input(f"{Colors.LIGHT_CYAN}Enter the download path (leave empty for current directory): {Colors.RESET}")
@@ -362,10 +2198,10 @@ def main():
                 download_path = os.getcwd()
             action = input(f"{Colors.LIGHT_CYAN}Do you want to add this playlist download to the queue or start immediately? (q/i): {Colors.RESET}")
             if action == 'i':
-                download_playlist_best_audio(playlist_url, download_path)
+                download_playlist_best_audio(playlist_url, download_path, config["max_workers"])
             else:
-                add_download_to_queue(playlist_url, 'bestaudio/best', download_path, config)
-                print_colored("Added playlist download (Best Audio Quality) to the queue.", Colors.LIGHT_GREEN)
+                if add_download_to_queue(playlist_url, 'bestaudio/best', download_path, config):
+                    print_colored("Added playlist download (Best Audio Quality) to the queue.", Colors.LIGHT_GREEN)
         elif choice == '5':
             playlist_url = input(f"{Colors.LIGHT_CYAN}Enter the playlist URL: {Colors.RESET}")
             download_path = input(f"{Colors.LIGHT_CYAN}Enter the download path (leave empty for current directory): {Colors.RESET}")
@@ -373,10 +2209,10 @@ def main():
                 download_path = os.getcwd()
             action = input(f"{Colors.LIGHT_CYAN}Do you want to add this playlist download to the queue or start immediately? (q/i): {Colors.RESET}")
             if action == 'i':
-                download_playlist_best_quality(playlist_url, download_path)
+                download_playlist_best_quality(playlist_url, download_path, config["max_workers"])
             else:
-                add_download_to_queue(playlist_url, 'bestvideo+bestaudio/best', download_path, config)
-                print_colored("Added playlist download (Best Quality) to the queue.", Colors.LIGHT_GREEN)
+                if add_download_to_queue(playlist_url, 'bestvideo+bestaudio/best', download_path, config):
+                    print_colored("Added playlist download (Best Quality) to the queue.", Colors.LIGHT_GREEN)
         elif choice == '6':
             # Prompt user for next action
             print(f"{Colors.LIGHT_CYAN}Once the download queue has finished, what would you like to do next?{Colors.RESET}")
@@ -403,11 +2239,15 @@ def main():
             update_and_restart_youtube()
         elif choice == '8':
             latest_version = get_latest_version_yt_dlp()
-            local_version = get_local_version_yt_dlp()
+            try:
+                local_version = get_local_version_yt_dlp()
+            except subprocess.TimeoutExpired:
+                print_colored("yt-dlp did not report its version in time.", Colors.LIGHT_RED)
+                continue
             if latest_version and local_version != latest_version:
                 print_colored(f"Downloading the latest version of yt-dlp (v{latest_version})...", Colors.LIGHT_CYAN)
-                download_latest_version_yt_dlp(latest_version)
-                print_colored("yt-dlp has been updated.", Colors.LIGHT_GREEN)
+                if download_latest_version_yt_dlp(latest_version):
+                    print_colored("yt-dlp has been updated.", Colors.LIGHT_GREEN)
             else:
                 print_colored("yt-dlp is already up-to-date.", Colors.LIGHT_GREEN)
 
@@ -417,5 +2257,116 @@ def main():
         else:
             print_colored("Invalid choice. Please try again.", Colors.LIGHT_RED)
 
+# Function to read URLs from the command line, a URL file or stdin ('-'), skipping blank and # lines
+def read_cli_urls(urls, input_file):
+    urls = list(urls)
+    if input_file:
+        source = sys.stdin if input_file == '-' else open(input_file, 'r', encoding='utf-8')
+        with source:
+            urls += [line.strip() for line in source if line.strip() and not line.strip().startswith('#')]
+    return urls
+
+# Function to build the headless command line parser
+def build_cli_parser():
+    parser = argparse.ArgumentParser(prog='YTGet', description="Headless YTGet. Run without arguments for the interactive menu.")
+    parser.add_argument('--version', action='version', version=f"YTGet {__version__}")
+    parser.add_argument('--yt-dlp', dest='yt_dlp', help="yt-dlp executable to use (overrides yt_dlp_path)")
+    parser.add_argument('--connections', type=int, help="Parallel connections per download (overrides connections)")
+    parser.add_argument('--backend', choices=['subprocess', 'library'],
+                        help="Run yt-dlp as a process or in-process as a library (overrides yt_dlp_backend)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="Add videos or playlists to the download queue")
+    add_parser.add_argument('urls', nargs='*', help="URLs to queue")
+    add_parser.add_argument('-i', '--input', help="File with one URL per line, or '-' for stdin")
+    add_parser.add_argument('-f', '--format', default='bestvideo+bestaudio/best', help="yt-dlp format code")
+    add_parser.add_argument('-s', '--select', help="Pick each URL's format by rule, e.g. '<=1080p, prefer=av01, smallest'")
+    add_parser.add_argument('-o', '--output', help="Download path (defaults to the configured download path)")
+    add_parser.add_argument('-p', '--postprocess', help=f"Post-processing steps, comma-separated: {', '.join(POSTPROCESS_STEPS)}")
+
+    run_parser = subparsers.add_parser('run-queue', help="Download everything in the queue")
+    run_parser.add_argument('--workers', type=int, help="Parallel downloads (overrides max_workers)")
+    run_parser.add_argument('--per-host', type=int, help="Parallel downloads per site (overrides max_per_host)")
+
+    formats_parser = subparsers.add_parser('formats', help="List the available formats of a video")
+    formats_parser.add_argument('url')
+    formats_parser.add_argument('-s', '--select', help="Print only the format code picked by this rule")
+
+    playlist_parser = subparsers.add_parser('playlist', help="Download a playlist")
+    playlist_parser.add_argument('url')
+    playlist_parser.add_argument('--audio', action='store_true', help="Best audio only instead of best quality")
+    playlist_parser.add_argument('-o', '--output', help="Download path (defaults to the configured download path)")
+    playlist_parser.add_argument('--workers', type=int, help="Parallel downloads (overrides max_workers)")
+    return parser
+
+# Function to run a headless command. No connectivity probe or update check is made. Returns the exit code.
+def run_cli(argv):
+    global yt_dlp_path
+    args = build_cli_parser().parse_args(argv)
+    config = load_config()
+    if args.yt_dlp:
+        yt_dlp_path = args.yt_dlp
+    if args.backend:
+        set_yt_dlp_backend(args.backend)
+    if args.connections:
+        set_transfer_options(args.connections, external_downloader)
+
+    if args.command == 'add':
+        try:
+            urls = read_cli_urls(args.urls, args.input)
+        except OSError as e:
+            print_colored(str(e), Colors.LIGHT_RED)
+            return 2
+        if not urls:
+            print_colored("No URLs given.", Colors.LIGHT_RED)
+            return 2
+        try:
+            postprocess = parse_postprocess_steps(args.postprocess) if args.postprocess is not None else None
+        except ValueError as e:
+            print_colored(str(e), Colors.LIGHT_RED)
+            return 2
+        if args.select:
+            try:
+                format_codes = select_formats(urls, args.select, config["max_workers"])
+            except ValueError as e:
+                print_colored(str(e), Colors.LIGHT_RED)
+                return 2
+            for url in [url for url, code in format_codes.items() if not code]:
+                print_colored(f"No format of {url} matches the rule. Skipping it.", Colors.LIGHT_RED)
+            added = sum(add_download_to_queue(url, code, args.output, config, postprocess) for url, code in format_codes.items() if code)
+        else:
+            added = sum(add_download_to_queue(url, args.format, args.output, config, postprocess) for url in urls)
+        print_colored(f"Added {added} download(s) to the queue.", Colors.LIGHT_GREEN)
+        return 0
+    if args.command == 'run-queue':
+        if args.workers:
+            config["max_workers"] = args.workers
+        if args.per_host:
+            config["max_per_host"] = args.per_host
+        return 1 if process_queue(config) else 0
+    if args.command == 'formats' and args.select:
+        try:
+            format_code = select_formats([args.url], args.select)[args.url]
+        except ValueError as e:
+            print_colored(str(e), Colors.LIGHT_RED)
+            return 2
+        if format_code:
+            print(format_code)
+        return 0 if format_code else 1
+    if args.command == 'formats':
+        formats = get_available_formats(args.url)
+        print(formats)
+        return 0 if formats else 1
+    if args.command == 'playlist':
+        download_path = args.output or config["download_path"] or os.getcwd()
+        format_code = 'bestaudio/best' if args.audio else 'bestvideo+bestaudio/best'
+        failed_urls = download_playlist(args.url, format_code, download_path, args.workers or config["max_workers"])
+        for video_url in failed_urls:
+            print_colored(f"Failed to download {video_url}.", Colors.LIGHT_RED)
+        return 1 if failed_urls else 0
+    return 2
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     main()
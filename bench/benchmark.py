@@ -0,0 +1,180 @@
+"""Offline benchmarks for YTGet's own overhead, run against bench/fake_yt_dlp.py.
+
+    python bench/benchmark.py                      # default sizes
+    python bench/benchmark.py --sizes 10,1000,100000 --run-sizes 10,1000
+    python bench/benchmark.py --json results.json  # save results
+    python bench/benchmark.py --compare results.json --tolerance 0.25
+
+Everything runs in a temporary directory, so the real queue, cache and archive are never touched.
+With --compare, timings that got slower than the saved run by more than the tolerance are reported
+and the exit code is 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+os.environ['YTGET_YT_DLP'] = os.path.join(BENCH_DIR, 'fake_yt_dlp.py')
+
+import YTGet  # noqa: E402
+
+
+def timed(function, *args):
+    """Run function once and return (result, seconds)."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def peak_memory(function, *args):
+    """Run function once and return its peak traced memory in bytes.
+
+    This is a separate run from the timed one: tracemalloc slows Python code down several times over.
+    """
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def reset_state():
+    if YTGet.queue_db is not None:
+        YTGet.queue_db.close()
+        YTGet.queue_db = None
+    YTGet.download_archives.clear()
+    for name in os.listdir('.'):
+        if name.startswith('YTGet_Queue.db'):
+            os.remove(name)
+
+
+def bench_spawn(results, repeat):
+    _, elapsed = timed(lambda: [YTGet.get_local_version_yt_dlp() for _ in range(repeat)])
+    results['spawn.per_call_ms'] = elapsed / repeat * 1000
+
+
+def bench_formats(results, repeat):
+    command = YTGet.get_yt_dlp_command() + ['-J', 'https://www.youtube.com/watch?v=bench000001']
+    info = json.loads(subprocess.run(command, capture_output=True, text=True).stdout)
+    _, elapsed = timed(lambda: [YTGet.format_records_table(YTGet.parse_format_records(info)) for _ in range(repeat)])
+    results['formats.parse_ms'] = elapsed / repeat * 1000
+    url = 'https://www.youtube.com/watch?v=bench000002'
+    _, results['formats.cold_ms'] = timed(YTGet.get_available_formats, url)
+    _, results['formats.warm_ms'] = timed(YTGet.get_available_formats, url)
+    results['formats.cold_ms'] *= 1000
+    results['formats.warm_ms'] *= 1000
+
+
+def bench_playlist(results, size):
+    os.environ['FAKE_YT_DLP_ENTRIES'] = str(size)
+    urls, elapsed = timed(YTGet.fetch_playlist_videos, 'https://www.youtube.com/playlist?list=PLbench')
+    assert len(urls) == size, f"expected {size} entries, got {len(urls)}"
+    results[f'playlist.{size}.entries_per_s'] = size / elapsed
+    peak = peak_memory(YTGet.fetch_playlist_videos, 'https://www.youtube.com/playlist?list=PLbench')
+    results[f'playlist.{size}.peak_mb'] = peak / 1024 / 1024
+
+
+def bench_persistence(results, size):
+    urls = [f"https://www.youtube.com/watch?v=q{index:010d}" for index in range(size)]
+
+    def add_all():
+        config = YTGet.load_config()
+        for url in urls:
+            YTGet.add_download_to_queue(url, 'best', None, config)
+    reset_state()
+    _, elapsed = timed(add_all)
+    results[f'queue.{size}.add_us'] = elapsed / size * 1e6
+    _, elapsed = timed(YTGet.get_pending_downloads)
+    results[f'queue.{size}.list_ms'] = elapsed * 1000
+    reset_state()
+    results[f'queue.{size}.add_peak_mb'] = peak_memory(add_all) / 1024 / 1024
+
+
+def fill_queue(size, workers):
+    reset_state()
+    config = YTGet.load_config()
+    config['max_workers'] = config['max_per_host'] = workers
+    for index in range(size):
+        YTGet.add_download_to_queue(f"https://www.youtube.com/watch?v=r{index:010d}", 'best', None, config)
+    return config
+
+
+def bench_queue_run(results, size, workers):
+    os.environ['FAKE_YT_DLP_SPEED'] = '0'
+    failed, elapsed = timed(YTGet.process_queue, fill_queue(size, workers))
+    assert failed == 0, f"{failed} fake downloads failed"
+    peak = peak_memory(YTGet.process_queue, fill_queue(size, workers))
+    results[f'run.{size}.items_per_s'] = size / elapsed
+    # Wall time per item beyond the spawn cost every item pays anyway, spread over the workers
+    spawn = results.get('spawn.per_call_ms', 0) / 1000
+    results[f'run.{size}.overhead_ms'] = max(0.0, elapsed * workers / size - spawn) * 1000
+    results[f'run.{size}.peak_mb'] = peak / 1024 / 1024
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, value in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        # Throughput should not drop, everything else should not grow
+        higher_is_better = key.endswith('_per_s')
+        change = (old - value) / old if higher_is_better else (value - old) / old
+        if change > tolerance:
+            regressions.append(f"{key}: {old:.3f} -> {value:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YTGet against a fake yt-dlp.")
+    parser.add_argument('--sizes', default='10,1000,100000', help="queue and playlist sizes for persistence and parsing")
+    parser.add_argument('--run-sizes', default='10,1000', help="queue sizes to actually download (one process per item)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file from an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before a regression is reported")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    run_sizes = [int(size) for size in args.run_sizes.split(',') if size]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        os.environ['FAKE_YT_DLP_WRITE'] = '0'
+        bench_spawn(results, 20)
+        bench_formats(results, 200)
+        for size in sizes:
+            bench_playlist(results, size)
+            bench_persistence(results, size)
+        for size in run_sizes:
+            bench_queue_run(results, size, args.workers)
+        reset_state()
+        os.chdir(BENCH_DIR)
+
+    for key, value in results.items():
+        print(f"{key:<32} {value:12.3f}")
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=4)
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Offline stand-in for yt-dlp, used by the benchmarks.
+
+Supports the calls YTGet makes: --version, -J, -F, --flat-playlist -j and downloads with
+--progress-template, --download-archive and -o, including "-f 137,140" downloads of separate streams. Behaviour is controlled with environment variables:
+
+    FAKE_YT_DLP_STARTUP     seconds to sleep before doing anything (default 0)
+    FAKE_YT_DLP_SIZE        bytes per downloaded file (default 10 MiB)
+    FAKE_YT_DLP_SPEED       bytes per second, 0 for instant (default 0)
+    FAKE_YT_DLP_FRAGMENTS   fragments per download (default 10)
+    FAKE_YT_DLP_ENTRIES     entries in a flat playlist (default 100)
+    FAKE_YT_DLP_ENTRY_DELAY seconds between playlist entries (default 0)
+    FAKE_YT_DLP_FAIL        URLs containing this text fail with "Video unavailable"
+    FAKE_YT_DLP_WRITE       set to 1 to create the output files (empty) and archive entries
+"""
+import json
+import os
+import sys
+import time
+import urllib.parse
+
+VERSION = '2024.08.06'
+
+# (format id, ext, width, height, fps, vcodec, acodec, tbr, protocol, note), like a typical YouTube video
+FORMATS = [
+    ('sb2', 'mhtml', 48, 27, 0, 'none', 'none', 0, 'mhtml', 'storyboard'),
+    ('sb1', 'mhtml', 80, 45, 0, 'none', 'none', 0, 'mhtml', 'storyboard'),
+    ('sb0', 'mhtml', 160, 90, 0, 'none', 'none', 0, 'mhtml', 'storyboard'),
+    ('233', 'mp4', None, None, None, 'none', 'unknown', 0, 'm3u8_native', 'Default'),
+    ('234', 'mp4', None, None, None, 'none', 'unknown', 0, 'm3u8_native', 'Default'),
+    ('139-drc', 'm4a', None, None, None, 'none', 'mp4a.40.5', 49, 'https', 'low, DRC'),
+    ('139', 'm4a', None, None, None, 'none', 'mp4a.40.5', 49, 'https', 'low'),
+    ('249', 'webm', None, None, None, 'none', 'opus', 54, 'https', 'low'),
+    ('250', 'webm', None, None, None, 'none', 'opus', 71, 'https', 'low'),
+    ('140', 'm4a', None, None, None, 'none', 'mp4a.40.2', 130, 'https', 'medium'),
+    ('251', 'webm', None, None, None, 'none', 'opus', 136, 'https', 'medium'),
+    ('18', 'mp4', 640, 360, 30, 'avc1.42001E', 'mp4a.40.2', 563, 'https', '360p'),
+    ('160', 'mp4', 256, 144, 30, 'avc1.4d400c', 'none', 82, 'https', '144p'),
+    ('278', 'webm', 256, 144, 30, 'vp9', 'none', 73, 'https', '144p'),
+    ('394', 'mp4', 256, 144, 30, 'av01.0.00M.08', 'none', 70, 'https', '144p'),
+    ('133', 'mp4', 426, 240, 30, 'avc1.4d4015', 'none', 181, 'https', '240p'),
+    ('242', 'webm', 426, 240, 30, 'vp9', 'none', 162, 'https', '240p'),
+    ('395', 'mp4', 426, 240, 30, 'av01.0.00M.08', 'none', 156, 'https', '240p'),
+    ('134', 'mp4', 640, 360, 30, 'avc1.4d401e', 'none', 382, 'https', '360p'),
+    ('243', 'webm', 640, 360, 30, 'vp9', 'none', 297, 'https', '360p'),
+    ('396', 'mp4', 640, 360, 30, 'av01.0.01M.08', 'none', 279, 'https', '360p'),
+    ('135', 'mp4', 854, 480, 30, 'avc1.4d401f', 'none', 706, 'https', '480p'),
+    ('244', 'webm', 854, 480, 30, 'vp9', 'none', 541, 'https', '480p'),
+    ('397', 'mp4', 854, 480, 30, 'av01.0.04M.08', 'none', 494, 'https', '480p'),
+    ('136', 'mp4', 1280, 720, 30, 'avc1.4d401f', 'none', 1360, 'https', '720p'),
+    ('247', 'webm', 1280, 720, 30, 'vp9', 'none', 1072, 'https', '720p'),
+    ('398', 'mp4', 1280, 720, 30, 'av01.0.05M.08', 'none', 992, 'https', '720p'),
+    ('137', 'mp4', 1920, 1080, 30, 'avc1.640028', 'none', 4246, 'https', '1080p'),
+    ('248', 'webm', 1920, 1080, 30, 'vp9', 'none', 2646, 'https', '1080p'),
+    ('399', 'mp4', 1920, 1080, 30, 'av01.0.08M.08', 'none', 1813, 'https', '1080p'),
+]
+DURATION = 212
+
+
+def env(name, default):
+    return type(default)(os.environ.get(name, default))
+
+
+def option(args, name, default=None):
+    return args[args.index(name) + 1] if name in args else default
+
+
+def video_id(url):
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    return query.get('v', [url.rstrip('/').rsplit('/', 1)[-1]])[0][:11]
+
+
+def info_dict(url):
+    vid = video_id(url)
+    formats = []
+    for format_id, ext, width, height, fps, vcodec, acodec, tbr, protocol, note in FORMATS:
+        formats.append({
+            'format_id': format_id, 'ext': ext, 'width': width, 'height': height, 'fps': fps,
+            'resolution': f"{width}x{height}" if width else 'audio only',
+            'vcodec': vcodec, 'acodec': acodec, 'tbr': tbr or None, 'protocol': protocol, 'format_note': note,
+            'filesize': int(tbr * 1000 / 8 * DURATION) if tbr else None,
+            'url': f"https://fake.invalid/{vid}/{format_id}",
+        })
+    return {
+        'id': vid, 'title': f"Fake video {vid}", 'extractor': 'youtube', 'extractor_key': 'Youtube',
+        'webpage_url': f"https://www.youtube.com/watch?v={vid}", 'duration': DURATION, 'formats': formats,
+    }
+
+
+def print_format_table(url):
+    print(f"[youtube] Extracting URL: {url}")
+    print(f"[info] Available formats for {video_id(url)}:")
+    print("ID      EXT   RESOLUTION FPS |   FILESIZE   TBR PROTO       | VCODEC          ACODEC      MORE INFO")
+    print("-" * 100)
+    for fmt in info_dict(url)['formats']:
+        size = f"{fmt['filesize'] / 1024 / 1024:.2f}MiB" if fmt['filesize'] else ''
+        print(f"{fmt['format_id']:<7} {fmt['ext']:<5} {fmt['resolution']:<10} {fmt['fps'] or '':>3} | {size:>10} "
+              f"{(str(fmt['tbr']) + 'k') if fmt['tbr'] else '':>5} {fmt['protocol']:<11} | {fmt['vcodec']:<15} "
+              f"{fmt['acodec']:<11} {fmt['format_note']}")
+
+
+def print_flat_playlist(url):
+    delay = env('FAKE_YT_DLP_ENTRY_DELAY', 0.0)
+    for index in range(env('FAKE_YT_DLP_ENTRIES', 100)):
+        vid = f"fake{index:07d}"
+        print(json.dumps({
+            '_type': 'url', 'ie_key': 'Youtube', 'id': vid, 'title': f"Fake video {vid}",
+            'url': f"https://www.youtube.com/watch?v={vid}", 'duration': DURATION, 'playlist_index': index + 1,
+        }), flush=True)
+        if delay:
+            time.sleep(delay)
+
+
+def download(args):
+    url = option(args, '--load-info-json')
+    if url:
+        with open(url, 'r') as info_file:
+            url = json.load(info_file)['webpage_url']
+    else:
+        url = next(arg for arg in args if arg.startswith(('http://', 'https://')))
+    fail = os.environ.get('FAKE_YT_DLP_FAIL')
+    if fail and fail in url:
+        print(f"ERROR: [youtube] {video_id(url)}: Video unavailable. This video has been removed", file=sys.stderr)
+        return 1
+
+    info = info_dict(url)
+    extensions = {fmt['format_id']: fmt['ext'] for fmt in info['formats']}
+    template = option(args, '--progress-template', '')
+    prefix = template.split(':', 1)[1].replace('%(progress)j', '') if template.startswith('download:') else None
+    for format_id in option(args, '-f', 'best').split(','):
+        filename = (option(args, '-o', '%(title)s.%(ext)s').replace('%(title)s', info['title'])
+                    .replace('%(format_id)s', format_id).replace('%(ext)s', extensions.get(format_id, 'mp4')))
+        download_file(filename, prefix)
+    if os.environ.get('FAKE_YT_DLP_WRITE') == '1':
+        archive = option(args, '--download-archive')
+        if archive:
+            with open(archive, 'a') as archive_file:
+                archive_file.write(f"youtube {info['id']}\n")
+    return 0
+
+
+def download_file(filename, prefix):
+    size = env('FAKE_YT_DLP_SIZE', 10 * 1024 * 1024)
+    speed = env('FAKE_YT_DLP_SPEED', 0.0)
+    fragments = max(1, env('FAKE_YT_DLP_FRAGMENTS', 10))
+    start = time.time()
+    for index in range(1, fragments + 1):
+        downloaded = size * index // fragments
+        if speed:
+            time.sleep(max(0.0, downloaded / speed - (time.time() - start)))
+        if prefix is not None:
+            elapsed = time.time() - start
+            current = downloaded / elapsed if elapsed > 0 else None
+            print(prefix + json.dumps({
+                'status': 'downloading', 'filename': filename, 'tmpfilename': filename + '.part',
+                'downloaded_bytes': downloaded, 'total_bytes_estimate': size, 'elapsed': elapsed, 'speed': current,
+                'eta': (size - downloaded) / current if current else None,
+                'fragment_index': index, 'fragment_count': fragments,
+            }), flush=True)
+    if prefix is not None:
+        print(prefix + json.dumps({'status': 'finished', 'filename': filename, 'downloaded_bytes': size,
+                                   'total_bytes': size, 'elapsed': time.time() - start}), flush=True)
+    if os.environ.get('FAKE_YT_DLP_WRITE') == '1':
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        open(filename, 'wb').close()
+
+
+def main(args):
+    time.sleep(env('FAKE_YT_DLP_STARTUP', 0.0))
+    if '--version' in args:
+        print(VERSION)
+    elif '--flat-playlist' in args:
+        print_flat_playlist(args[-1])
+    elif '-J' in args:
+        print(json.dumps(info_dict(args[-1])))
+    elif '-F' in args:
+        print_format_table(args[-1])
+    else:
+        return download(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
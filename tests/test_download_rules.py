@@ -0,0 +1,121 @@
+"""Error classification, retry delays, bandwidth windows and URL keys, run offline.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import YTGet  # noqa: E402
+
+
+@pytest.mark.parametrize('returncode, error, error_class', [
+    (1, 'ERROR: [youtube] abcdefghijk: Video unavailable. This video has been removed', 'permanent'),
+    (1, 'ERROR: [youtube] abcdefghijk: Private video. Sign in if you have been granted access', 'permanent'),
+    (1, 'ERROR: unable to download video data: HTTP Error 429: Too Many Requests', 'rate_limited'),
+    (1, "ERROR: [youtube] abcdefghijk: Sign in to confirm you're not a bot", 'rate_limited'),
+    (1, 'ERROR: fragment 12 not found, unable to continue', 'fragment'),
+    (1, 'ERROR: Unable to download webpage: <urlopen error timed out>', 'network'),
+    (1, 'ERROR: unable to download video data: HTTP Error 503: Service Unavailable', 'network'),
+    (1, 'ERROR: unable to write data: [Errno 28] No space left on device', 'permanent'),
+    (2, 'yt-dlp: error: no such option: --bogus', 'permanent'),
+    (1, 'ERROR: something nobody has seen before', 'transient'),
+    (1, None, 'transient'),
+])
+def test_classify_download_error(returncode, error, error_class):
+    assert YTGet.classify_download_error(returncode, error) == error_class
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert 30 <= YTGet.get_retry_delay('rate_limited', 1) <= 90
+    assert 10 <= YTGet.get_retry_delay('network', 2) <= 30
+    assert YTGet.get_retry_delay('network', 20) <= YTGet.RETRY_MAX_DELAY * 1.5
+
+
+def test_missing_yt_dlp_is_permanent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('YTGET_YT_DLP', str(tmp_path / 'missing-yt-dlp'))
+    success, error_class, _ = YTGet.attempt_download('https://www.youtube.com/watch?v=abcdefghijk', 'best', str(tmp_path),
+                                                     quiet=True, use_info_json=False)
+    assert (success, error_class) == (False, 'permanent')
+
+
+def test_failed_playlist_listing_raises(tmp_path, monkeypatch):
+    stand_in = tmp_path / 'yt_dlp.py'
+    stand_in.write_text("import sys\n"
+                        "print('ERROR: [youtube:tab] PL1: HTTP Error 429: Too Many Requests', file=sys.stderr)\n"
+                        "sys.exit(1)\n")
+    monkeypatch.setenv('YTGET_YT_DLP', str(stand_in))
+    with pytest.raises(RuntimeError, match='HTTP Error 429'):
+        list(YTGet.stream_playlist_entries('https://www.youtube.com/playlist?list=PL1'))
+
+
+@pytest.mark.parametrize('value, rate', [(None, None), ('', None), (2000000, 2000000), ('500K', 512000),
+                                         ('2M', 2 * 1024 ** 2), ('1.5MB/s', int(1.5 * 1024 ** 2)), ('0', 0)])
+def test_parse_rate(value, rate):
+    assert YTGet.parse_rate(value) == rate
+
+
+@pytest.mark.parametrize('value', ['fast', '2X', '-1M'])
+def test_parse_rate_rejects_bad_values(value):
+    with pytest.raises(ValueError):
+        YTGet.parse_rate(value)
+
+
+def at(clock):
+    return time.strptime(clock, '%H:%M')
+
+
+@pytest.mark.parametrize('start, end, clock, inside', [
+    ('01:00', '07:00', '01:00', True),
+    ('01:00', '07:00', '06:59', True),
+    ('01:00', '07:00', '07:00', False),
+    ('1:00', '7:00', '03:30', True),
+    ('23:00', '06:00', '23:30', True),
+    ('23:00', '06:00', '00:00', True),
+    ('23:00', '06:00', '05:59', True),
+    ('23:00', '06:00', '06:00', False),
+    ('23:00', '06:00', '12:00', False),
+])
+def test_is_in_time_window(start, end, clock, inside):
+    assert YTGet.is_in_time_window(start, end, at(clock)) is inside
+
+
+def test_bandwidth_windows_override_the_limit():
+    config = {'bandwidth_limit': '1M', 'bandwidth_windows': [{'start': '23:00', 'end': '6:00', 'limit': None},
+                                                             {'start': '18:00', 'end': '23:00', 'limit': 0}]}
+    YTGet.check_bandwidth_settings(config)
+    day = time.mktime(time.strptime('2024-01-01 12:00', '%Y-%m-%d %H:%M'))
+    assert YTGet.get_bandwidth_limit(config, day) == 1024 ** 2
+    assert YTGet.get_bandwidth_limit(config, day + 7 * 3600) == 0
+    assert YTGet.get_bandwidth_limit(config, day + 13 * 3600) is None
+
+
+@pytest.mark.parametrize('config', [
+    {'bandwidth_limit': 'fast'},
+    {'bandwidth_windows': [{'start': '25:00', 'end': '06:00'}]},
+    {'bandwidth_windows': [{'start': '1am', 'end': '06:00'}]},
+    {'bandwidth_windows': [{'start': '01:00'}]},
+    {'bandwidth_windows': [{'start': '01:00', 'end': '06:00', 'limit': 'slow'}]},
+])
+def test_check_bandwidth_settings_rejects_typos(config):
+    with pytest.raises(ValueError):
+        YTGet.check_bandwidth_settings(config)
+
+
+@pytest.mark.parametrize('url, key', [
+    ('https://www.youtube.com/watch?v=abcdefghijk', 'youtube:abcdefghijk'),
+    ('https://youtu.be/abcdefghijk?t=5', 'youtube:abcdefghijk'),
+    ('https://m.youtube.com/watch?v=abcdefghijk&list=PL1', 'youtube:abcdefghijk'),
+    ('https://music.youtube.com/watch?v=abcdefghijk', 'youtube:abcdefghijk'),
+    ('https://www.youtube.com/shorts/abcdefghijk', 'youtube:abcdefghijk'),
+    ('https://www.youtube.com/playlist?list=PL1', 'youtube.com/playlist?list=PL1'),
+    ('https://vimeo.com/123/?b=2&a=1', 'vimeo.com/123?a=1&b=2'),
+])
+def test_normalize_video_url(url, key):
+    assert YTGet.normalize_video_url(url) == key
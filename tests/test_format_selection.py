@@ -0,0 +1,77 @@
+"""Format parsing and rule-based selection, run offline against the formats of bench/fake_yt_dlp.py.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(TESTS_DIR), os.path.join(os.path.dirname(TESTS_DIR), 'bench')]
+
+import YTGet  # noqa: E402
+import fake_yt_dlp  # noqa: E402
+
+URL = 'https://www.youtube.com/watch?v=abcdefghijk'
+
+
+@pytest.fixture
+def records():
+    return YTGet.parse_format_records(fake_yt_dlp.info_dict(URL))
+
+
+def video_format(format_id, height, vcodec, acodec, tbr, ext='mp4'):
+    return {'format_id': format_id, 'ext': ext, 'height': height, 'vcodec': vcodec, 'acodec': acodec, 'tbr': tbr}
+
+
+def test_excluded_formats_are_dropped(records):
+    format_ids = {record['format_id'] for record in records}
+    assert not format_ids & {'18', '233', '234', '139-drc', 'sb0', 'sb1', 'sb2'}
+    assert {'139', '140', '137', '399'} <= format_ids
+
+
+def test_exclusion_matches_whole_format_ids():
+    info = {'formats': [video_format('180', 360, 'avc1', 'mp4a.40.2', 500), video_format('118', 360, 'avc1', 'none', 400),
+                        video_format('18', 360, 'avc1', 'mp4a.40.2', 563)]}
+    assert [record['format_id'] for record in YTGet.parse_format_records(info)] == ['180', '118']
+
+
+@pytest.mark.parametrize('rule, format_code', [
+    ('<720', '135+251'),
+    ('<=720p', '136+251'),
+    ('>720', '137+251'),
+    ('>=720, smallest', '399+251'),
+    ('prefer=av01', '399+251'),
+    ('container=mp4, <=480', '135+140'),
+    ('container=webm, prefer=vp9', '248+251'),
+    ('audio-only', '251'),
+    ('audio-only, audio=aac', '140'),
+])
+def test_select_format(records, rule, format_code):
+    assert YTGet.select_format(records, rule) == format_code
+
+
+def test_select_format_without_a_match(records):
+    assert YTGet.select_format(records, '<100') is None
+
+
+def test_select_format_falls_back_to_muxed_formats():
+    records = YTGet.parse_format_records({'formats': [
+        video_format('22', 720, 'avc1', 'mp4a.40.2', 1200), video_format('43', 360, 'vp8', 'vorbis', 600, 'webm')]})
+    assert YTGet.select_format(records, '<=1080p') == '22'
+    assert YTGet.select_format(records, '<720') == '43'
+
+
+def test_format_rules():
+    assert YTGet.parse_format_rule('<720p')['max_height'] == 719
+    assert YTGet.parse_format_rule('>=720')['min_height'] == 720
+    assert YTGet.parse_format_rule('prefer=av01|vp9')['vcodecs'] == ['av01', 'vp9']
+    with pytest.raises(ValueError):
+        YTGet.parse_format_rule('<=1080p, fastest')
+
+
+@pytest.mark.parametrize('text, is_rule', [('<=1080p', True), ('audio-only', True), ('137+140', False),
+                                           ('bestvideo+bestaudio/best', False), ('best', False)])
+def test_is_format_rule(text, is_rule):
+    assert YTGet.is_format_rule(text) is is_rule